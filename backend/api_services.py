@@ -1,21 +1,20 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
 import json
 import pika
 
-from connections import get_postgres_connection, get_rabbitmq_connection
+from connections import get_postgres_connection, rabbitmq_pool
 
 
 def test_rabbitmq() -> str:
+    """
+    Revisa RabbitMQ con un canal del pool (atiende heartbeats y detecta
+    sockets muertos) sin publicar nada.
+    """
     try:
-        with get_rabbitmq_connection() as connection:
-            channel = connection.channel()
-            channel.queue_declare(queue='test_queue', durable=True)
-            channel.basic_publish(
-                exchange='',
-                routing_key='test_queue',
-                body='Health check test'
-            )
+        with rabbitmq_pool.channel() as pooled:
+            if not pooled.is_healthy():
+                return "RabbitMQ Error: la conexión no responde"
         return "RabbitMQ OK - Todo bien"
     except Exception as e:
         return f"RabbitMQ Error: {str(e)}"
@@ -24,7 +23,7 @@ def test_postgres() -> str:
     try:
         with get_postgres_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT version();")
+            cursor.execute("SELECT 1;")
             cursor.close()
         return f"PostgreSQL OK - Todo bien"
     except Exception as e:
@@ -32,29 +31,51 @@ def test_postgres() -> str:
 
 def send_message_to_rabbit(message: str, queue: str) -> str:
     try:
-        with get_rabbitmq_connection() as connection:
-            channel = connection.channel()
-            channel.queue_declare(queue=queue, durable=True)
-            channel.basic_publish(
-                exchange='',
-                routing_key=queue,
-                body=message,
-                properties=pika.BasicProperties(delivery_mode=2)
-            )
+        with rabbitmq_pool.channel() as pooled:
+            _publish(pooled, message, queue)
         return f"Mensaje enviado a RabbitMQ: '{message}'"
     except Exception as e:
         return f"Error al enviar: {str(e)}"
 
 
+def send_messages_to_rabbit(messages: List[Tuple[str, str]], correlation_id: Optional[str] = None) -> List[str]:
+    """
+    Publica varios mensajes (mensaje, cola) usando un solo canal del pool.
+
+    Cada publicación queda confirmada por el broker antes de seguir con la
+    siguiente, así que si alguna falla las anteriores ya están a salvo.
+    `correlation_id` se adjunta a todos los mensajes para que el worker pueda
+    volver a unir las partes de un mismo itinerario.
+    """
+    results = []
+    try:
+        with rabbitmq_pool.channel() as pooled:
+            for message, queue in messages:
+                _publish(pooled, message, queue, correlation_id)
+                results.append(f"Mensaje enviado a RabbitMQ: '{message}'")
+    except Exception as e:
+        results.extend(f"Error al enviar: {str(e)}" for _ in range(len(messages) - len(results)))
+    return results
+
+
+def _publish(pooled, message: str, queue: str, correlation_id: Optional[str] = None) -> None:
+    pooled.declare_queue(queue)
+    pooled.channel.basic_publish(
+        exchange='',
+        routing_key=queue,
+        body=message,
+        properties=pika.BasicProperties(delivery_mode=2, correlation_id=correlation_id)
+    )
+
+
 def read_messages_from_rabbit(limit: int, queue: str) -> List[Dict[str, Any]]:
     try:
-        with get_rabbitmq_connection() as connection:
-            channel = connection.channel()
-            channel.queue_declare(queue=queue, durable=True)
+        with rabbitmq_pool.channel() as pooled:
+            pooled.declare_queue(queue)
 
             messages = []
             for _ in range(limit):
-                method, properties, body = channel.basic_get(
+                method, properties, body = pooled.channel.basic_get(
                     queue=queue,
                     auto_ack=True
                 )
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import List, NamedTuple
+
+from crewai import BaseLLM
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+FIXTURES_DIR = Path(__file__).resolve().parent / "fixtures"
+
+
+def load_fixture(name: str):
+    with open(FIXTURES_DIR / name, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class Latency(NamedTuple):
+    """
+    Latencias simuladas en segundos. `jitter` es la variación relativa
+    (0.2 = ±20 %).
+    """
+    openweather: float = 0.15
+    places: float = 0.3
+    crew_llm: float = 1.5
+    ollama_prefill: float = 0.8
+    ollama_token: float = 0.02
+    ollama_tokens: int = 400
+    postgres: float = 0.01
+    rabbitmq: float = 0.002
+    jitter: float = 0.2
+
+    def scaled(self, factor: float) -> 'Latency':
+        return self._replace(**{
+            field: getattr(self, field) * factor
+            for field in ('openweather', 'places', 'crew_llm', 'ollama_prefill', 'ollama_token', 'postgres',
+                          'rabbitmq')
+        })
+
+
+def _sleep(seconds: float, jitter: float) -> None:
+    if seconds > 0:
+        time.sleep(seconds * random.uniform(1 - jitter, 1 + jitter))
+
+
+class FakeResponse:
+    def __init__(self, data, status_code: int = 200):
+        self._data = data
+        self.status_code = status_code
+        self.text = json.dumps(data, ensure_ascii=False)
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+class FakeOpenWeatherSession:
+    """
+    Reemplazo de la sesión de http_client para /weather y /forecast.
+    """
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.responses = {
+            "weather": load_fixture("openweather_weather.json"),
+            "forecast": load_fixture("openweather_forecast.json")
+        }
+
+    def get(self, url, params=None, timeout=None, **kwargs):
+        _sleep(self.latency.openweather, self.latency.jitter)
+        return FakeResponse(self.responses[url.rsplit('/', 1)[-1]])
+
+
+class FakePlacesClient:
+    """
+    Reemplazo de la sesión de http_client para places:searchNearby: responde
+    con los lugares del fixture que tienen alguno de los tipos pedidos.
+    """
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.places = load_fixture("places_nearby.json")["places"]
+
+    def post(self, url, headers=None, json=None, **kwargs):
+        _sleep(self.latency.places, self.latency.jitter)
+        included = set((json or {}).get('includedTypes', []))
+        places = [p for p in self.places if included & set(p['types'])] or self.places
+        return FakeResponse({"places": places[:(json or {}).get('maxResultCount', 10)]})
+
+
+class FakeCrewLLM(BaseLLM):
+    """
+    LLM de CrewAI que contesta según el output_pydantic de la Task con
+    respuestas armadas con los fixtures.
+    """
+
+    def __init__(self, latency: Latency):
+        super().__init__(model="benchmark-stub")
+        self.latency = latency
+        self.places = load_fixture("places_nearby.json")["places"]
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def call(self, messages, tools=None, callbacks=None, available_functions=None, from_task=None, from_agent=None):
+        _sleep(self.latency.crew_llm, self.latency.jitter)
+        schema = from_task.output_pydantic.__name__ if from_task and from_task.output_pydantic else None
+
+        if schema == "TourismAgentResponse":
+            answer = {"places": self.places[:5], "weather_note": "Lugares elegidos según el pronóstico."}
+        elif schema == "ReportInterests":
+            answer = {"selected_categories": ["museum", "park"]}
+        elif schema == "WeatherReport":
+            answer = _stub_weather_report()
+        else:
+            answer = "Contenido del archivo de categorías"
+        if not isinstance(answer, str):
+            answer = json.dumps(answer, ensure_ascii=False)
+        return f"Thought: Tengo la respuesta\nFinal Answer: {answer}"
+
+
+def _stub_weather_report():
+    from weather_agent import weather_api, weather_agent
+
+    current = weather_api.fetch_current_weather("Tunja")
+    forecast = weather_api.fetch_forecast("Tunja", 3)
+    return weather_agent.build_weather_report("Tunja", current, forecast)
+
+
+class FakeChatOllama:
+    """
+    Reemplazo de langchain.llm: espera el prefill y luego un tiempo por token,
+    y reporta usage_metadata como ChatOllama.
+    """
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        forecast = load_fixture("openweather_forecast.json")
+        self.words = ["Día", "1:", "Mañana", "en", "el", "centro", "histórico", "de",
+                      forecast["city"]["name"]] * (latency.ollama_tokens // 9 + 1)
+
+    def _usage(self, messages):
+        prompt_tokens = sum(len(str(content)) for _, content in messages) // 4
+        return {"input_tokens": prompt_tokens, "output_tokens": self.latency.ollama_tokens,
+                "total_tokens": prompt_tokens + self.latency.ollama_tokens}
+
+    def _text(self) -> str:
+        return ' '.join(self.words[:self.latency.ollama_tokens])
+
+    def invoke(self, messages, config=None):
+        _sleep(self.latency.ollama_prefill + self.latency.ollama_token * self.latency.ollama_tokens,
+               self.latency.jitter)
+        return AIMessage(content=self._text(), usage_metadata=self._usage(messages))
+
+    async def ainvoke(self, messages, config=None):
+        return await asyncio.to_thread(self.invoke, messages)
+
+    async def astream(self, messages, config=None):
+        await asyncio.sleep(self.latency.ollama_prefill)
+        for word in self.words[:self.latency.ollama_tokens]:
+            await asyncio.sleep(self.latency.ollama_token)
+            yield AIMessageChunk(content=word + ' ')
+        yield AIMessageChunk(content='', usage_metadata=self._usage(messages))
+
+    def batch(self, inputs: List, config=None, return_exceptions=False):
+        # Ollama con OLLAMA_NUM_PARALLEL atiende el lote a la vez
+        threads = []
+        results = [None] * len(inputs)
+
+        def run(i, messages):
+            results[i] = self.invoke(messages)
+
+        for i, messages in enumerate(inputs):
+            threads.append(threading.Thread(target=run, args=(i, messages)))
+            threads[-1].start()
+        for thread in threads:
+            thread.join()
+        return results
+
+
+class InMemoryBroker:
+    """
+    Colas en memoria con la interfaz de send_messages_to_rabbit y
+    read_messages_from_rabbit.
+    """
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.queues = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def send_messages(self, messages, correlation_id=None):
+        _sleep(self.latency.rabbitmq, self.latency.jitter)
+        with self._lock:
+            for message, queue in messages:
+                self.queues[queue].append(message)
+        return [f"Mensaje enviado a RabbitMQ: '{message}'" for message, _ in messages]
+
+    def read_messages(self, limit, queue):
+        _sleep(self.latency.rabbitmq, self.latency.jitter)
+        out = []
+        with self._lock:
+            while self.queues[queue] and len(out) < limit:
+                out.append(json.loads(self.queues[queue].popleft()))
+        return out
+
+
+def install(latency: Latency, cold_cache: bool = False) -> InMemoryBroker:
+    """
+    Reemplaza OpenWeatherMap, Google Places, los LLM de los crews, Ollama,
+    RabbitMQ y Postgres por los stubs. Se llama después de importar main.
+    """
+    import gazetteer
+    import itinerary_cache
+    import langchain
+    import main
+    import persistence
+    from tourism_agent import places_api, tourism_agent
+    from weather_agent import weather_api, weather_agent
+
+    weather_api.get_session = lambda: FakeOpenWeatherSession(latency)
+    places_api.get_session = lambda: FakePlacesClient(latency)
+
+    crew_llm = FakeCrewLLM(latency)
+    tourism_agent.tourism_agent.llm = crew_llm
+    weather_agent.info_agent.llm = crew_llm
+
+    langchain.llm = FakeChatOllama(latency)
+
+    broker = InMemoryBroker(latency)
+    main.send_messages_to_rabbit = broker.send_messages
+    main.read_messages_from_rabbit = broker.read_messages
+
+    itinerary_cache.ITINERARY_CACHE_ENABLED = False
+
+    def save_rows(rows):
+        _sleep(latency.postgres, latency.jitter)
+
+    def save_one(*args, **kwargs):
+        _sleep(latency.postgres, latency.jitter)
+
+    persistence.save_itinerary_rows = save_rows
+    # El gazetteer arranca vacío y aprende de las respuestas simuladas
+    gazetteer.gazetteer._loaded = True
+    gazetteer.gazetteer._persist = lambda keys, place: _sleep(latency.postgres, latency.jitter)
+    main.save_to_postgres = save_one
+
+    if cold_cache:
+        # Sin entradas en la LRU cada petición llega a las APIs simuladas
+        weather_api.weather_cache.local.max_entries = 0
+        places_api.places_cache.local.max_entries = 0
+
+    return broker
@@ -0,0 +1,278 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from connections import get_postgres_connection
+from singleflight import SingleFlight
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'none')
+CACHE_DIR = os.getenv('CACHE_DIR', str(Path(__file__).resolve().parent / '.cache'))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '1024'))
+# Cada cuántos segundos se borran de api_cache las entradas vencidas
+CACHE_PURGE_INTERVAL = int(os.getenv('CACHE_PURGE_INTERVAL', '600'))
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza nombres para usarlos como llave: sin tildes, en minúscula y con
+    espacios uniformes ("Bogotá,CO" y " bogota, co" dan lo mismo).
+    """
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'\s*,\s*', ',', text.strip().lower())
+    return re.sub(r'\s+', ' ', text)
+
+
+class LRUCacheBackend:
+    """
+    Cache en memoria del proceso, con tamaño máximo y desalojo LRU.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class FileCacheBackend:
+    """
+    Cache compartida en disco: un archivo JSON por llave dentro de `directory`.
+    """
+
+    def __init__(self, directory: str = CACHE_DIR):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / (hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data['value'], data['expires_at']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        path = self._path(key)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'value': value, 'expires_at': expires_at}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class PostgresCacheBackend:
+    """
+    Cache compartida entre procesos en la tabla api_cache. Las escrituras
+    borran de paso las entradas vencidas, a lo sumo una vez cada
+    `purge_interval` segundos por proceso.
+    """
+
+    def __init__(self, purge_interval: int = CACHE_PURGE_INTERVAL):
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                           SELECT value, EXTRACT(EPOCH FROM expires_at)
+                           FROM api_cache
+                           WHERE cache_key = %s;
+                           """, (key,))
+            row = cursor.fetchone()
+            cursor.close()
+        if row is None:
+            return None
+        return row[0], float(row[1])
+
+    def set(self, key: str, value: Any, expires_at: float) -> None:
+        with get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                           INSERT INTO api_cache (cache_key, value, expires_at)
+                           VALUES (%s, %s::jsonb, to_timestamp(%s))
+                           ON CONFLICT (cache_key) DO UPDATE
+                               SET value = EXCLUDED.value, expires_at = EXCLUDED.expires_at;
+                           """, (key, json.dumps(value, ensure_ascii=False), expires_at))
+            if self._purge_due():
+                cursor.execute("DELETE FROM api_cache WHERE expires_at < CURRENT_TIMESTAMP;")
+            conn.commit()
+            cursor.close()
+
+    def _purge_due(self) -> bool:
+        now = time.time()
+        with self._lock:
+            if now < self._next_purge:
+                return False
+            self._next_purge = now + self.purge_interval
+            return True
+
+
+def build_shared_backend(kind: str = CACHE_BACKEND):
+    if kind == 'postgres':
+        return PostgresCacheBackend()
+    if kind == 'file':
+        return FileCacheBackend()
+    return None
+
+
+class TTLCache:
+    """
+    Cache con TTL de dos niveles: LRU en memoria delante de un backend
+    compartido opcional (Postgres o archivos). Lleva contadores de hits y
+    misses por nivel.
+    """
+
+    def __init__(self, name: str, local: Optional[LRUCacheBackend] = None, shared=None):
+        self.name = name
+        self.local = local or LRUCacheBackend()
+        self.shared = shared
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.errors = 0
+        self._refreshing = set()
+        # Misses simultáneos de la misma llave hacen una sola llamada a la API
+        self._flights = SingleFlight(f"cache.{name}")
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _lookup(self, key: str) -> Optional[Tuple[Any, float, str]]:
+        """
+        (valor, vencimiento, contador) de la entrada vigente, donde contador
+        es 'hits' o 'shared_hits' según el nivel que respondió. No cuenta
+        nada: cada consulta la cuenta una sola vez quien llama.
+        """
+        now = time.time()
+        entry = self.local.get(key)
+        if entry is not None and entry[1] > now:
+            return entry[0], entry[1], 'hits'
+
+        if self.shared is not None:
+            try:
+                entry = self.shared.get(key)
+            except Exception as e:
+                print(f"Error leyendo cache {self.name}: {e}")
+                self._count('errors')
+                entry = None
+            if entry is not None and entry[1] > now:
+                self.local.set(key, entry[0], entry[1])
+                return entry[0], entry[1], 'shared_hits'
+
+        return None
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._lookup(key)
+        if entry is None:
+            self._count('misses')
+            return None
+        self._count(entry[2])
+        return entry[0]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        expires_at = time.time() + ttl
+        self.local.set(key, value, expires_at)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, expires_at)
+            except Exception as e:
+                print(f"Error escribiendo cache {self.name}: {e}")
+                self._count('errors')
+
+    def get_or_fetch(self, key: str, fetch: Callable[[], Any], ttl: float, stale_ttl: float = 0) -> Any:
+        """
+        Devuelve el valor en cache o llama a `fetch`. Los resultados None
+        (errores de la API) no se guardan.
+
+        Con `stale_ttl` la entrada se conserva ese tiempo extra después de
+        vencer: se sigue sirviendo mientras un hilo en segundo plano la
+        refresca (stale-while-revalidate).
+
+        Si otro hilo ya está buscando la misma llave se espera su resultado
+        (cuenta como `coalesced`, no como miss).
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            value, expires_at, level = entry
+            if time.time() < expires_at - stale_ttl:
+                self._count(level)
+            else:
+                self._count('stale_hits')
+                self._revalidate(key, fetch, ttl, stale_ttl)
+            return value
+
+        def fetch_and_store():
+            self._count('misses')
+            value = fetch()
+            if value is not None:
+                self.set(key, value, ttl + stale_ttl)
+            return value
+
+        return self._flights.do(key, fetch_and_store)
+
+    def _revalidate(self, key: str, fetch: Callable[[], Any], ttl: float, stale_ttl: float) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                value = fetch()
+                if value is not None:
+                    self.set(key, value, ttl + stale_ttl)
+            except Exception as e:
+                print(f"Error refrescando cache {self.name}: {e}")
+                self._count('errors')
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"cache-refresh-{self.name}", daemon=True).start()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self._flights.shared,
+            "errors": self.errors
+        }
+
+
+_registry: Dict[str, TTLCache] = {}
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    return {name: cache.stats() for name, cache in _registry.items()}
@@ -1,14 +1,20 @@
 import os
+import queue
+import threading
 
 import pika
 from dotenv import load_dotenv
 import psycopg2
+import psycopg2.pool
 from contextlib import contextmanager
 
 load_dotenv()
 
 RABBITMQ_URL = os.getenv('RABBITMQ_URL')
 DATABASE_URL = os.getenv('DATABASE_URL')
+RABBITMQ_POOL_SIZE = int(os.getenv('RABBITMQ_POOL_SIZE', '4'))
+POSTGRES_POOL_MIN = int(os.getenv('POSTGRES_POOL_MIN', '1'))
+POSTGRES_POOL_MAX = int(os.getenv('POSTGRES_POOL_MAX', '10'))
 
 print(f"Variables cargadas:  RABBITMQ_URL {os.getenv('DATABASE_URL')}" )
 print(f"Variables cargadas:  DATABASE_URL {os.getenv('DATABASE_URL')}" )
@@ -23,10 +29,186 @@ def get_rabbitmq_connection():
         connection.close()
 
 
-@contextmanager
+class PooledChannel:
+    """
+    Conexión + canal de RabbitMQ de larga vida con las colas ya declaradas.
+
+    pika.BlockingConnection no es thread-safe, así que cada entrada del pool
+    tiene su propia conexión y solo la usa un hilo a la vez.
+    """
+
+    def __init__(self, url: str):
+        self.connection = pika.BlockingConnection(pika.URLParameters(url))
+        self.channel = self.connection.channel()
+        # Con confirmaciones el broker responde cada publicación, así un
+        # mensaje perdido se reporta como error en vez de desaparecer.
+        self.channel.confirm_delivery()
+        self.declared_queues = set()
+
+    def declare_queue(self, queue_name: str) -> None:
+        if queue_name in self.declared_queues:
+            return
+        self.channel.queue_declare(queue=queue_name, durable=True)
+        self.declared_queues.add(queue_name)
+
+    def is_healthy(self) -> bool:
+        if not (self.connection.is_open and self.channel.is_open):
+            return False
+        try:
+            # Atiende heartbeats pendientes y detecta sockets muertos
+            self.connection.process_data_events(time_limit=0)
+            return True
+        except Exception:
+            return False
+
+    def close(self) -> None:
+        try:
+            if self.connection.is_open:
+                self.connection.close()
+        except Exception:
+            pass
+
+
+class RabbitMQChannelPool:
+    """
+    Pool thread-safe de canales de RabbitMQ que se reutilizan entre peticiones.
+
+    Los canales se crean bajo demanda hasta `size`; al devolverlos quedan
+    abiertos y se revisan antes de entregarlos de nuevo, reconectando si el
+    broker cerró la conexión.
+    """
+
+    def __init__(self, url: str, size: int = RABBITMQ_POOL_SIZE, acquire_timeout: float = 30.0):
+        self.url = url
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _acquire(self) -> PooledChannel:
+        try:
+            pooled = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                return self._connect()
+            pooled = self._idle.get(timeout=self.acquire_timeout)
+
+        if pooled.is_healthy():
+            return pooled
+
+        print("Canal de RabbitMQ caído, reconectando...")
+        pooled.close()
+        return self._connect()
+
+    def _connect(self) -> PooledChannel:
+        try:
+            return PooledChannel(self.url)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _release(self, pooled: PooledChannel, broken: bool) -> None:
+        if broken or self._closed:
+            pooled.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put_nowait(pooled)
+
+    @contextmanager
+    def channel(self):
+        pooled = self._acquire()
+        broken = False
+        try:
+            yield pooled
+        except (pika.exceptions.AMQPConnectionError, OSError):
+            broken = True
+            raise
+        finally:
+            self._release(pooled, broken or not pooled.channel.is_open)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            pooled.close()
+            with self._lock:
+                self._created -= 1
+
+
+rabbitmq_pool = RabbitMQChannelPool(RABBITMQ_URL)
+
+
+class PostgresPool:
+    """
+    ThreadedConnectionPool de psycopg2 que se crea en el primer uso y espera
+    (hasta `acquire_timeout`) en vez de fallar cuando todas las conexiones
+    están ocupadas.
+    """
+
+    def __init__(self, dsn: str, minconn: int = POSTGRES_POOL_MIN, maxconn: int = POSTGRES_POOL_MAX,
+                 acquire_timeout: float = 30.0):
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.acquire_timeout = acquire_timeout
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> psycopg2.pool.ThreadedConnectionPool:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = psycopg2.pool.ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn)
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise psycopg2.pool.PoolError("No hay conexiones libres en el pool de Postgres")
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+        except Exception:
+            self._slots.release()
+            raise
+
+        try:
+            yield conn
+        finally:
+            broken = conn.closed != 0
+            if not broken:
+                try:
+                    # Lo que no se confirmó no pasa a la siguiente petición
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            pool.putconn(conn, close=broken)
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+
+postgres_pool = PostgresPool(DATABASE_URL)
+
+
 def get_postgres_connection():
-    conn = psycopg2.connect(DATABASE_URL)
-    try:
-        yield conn
-    finally:
-        conn.close()
\ No newline at end of file
+    """
+    Conexión del pool de Postgres; se devuelve al salir del bloque with.
+    """
+    return postgres_pool.connection()
@@ -0,0 +1,51 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Crews de CrewAI: cada hilo ejecuta un itinerario completo y pasa la mayor
+# parte del tiempo esperando al LLM, por eso el límite es bajo y explícito
+agent_executor = ThreadPoolExecutor(max_workers=int(os.getenv('AGENT_EXECUTOR_WORKERS', '4')),
+                                    thread_name_prefix="agent")
+
+# Etapas que se solapan dentro de un mismo itinerario (p. ej. categorías
+# mientras corre el agente del clima). Lo que corre aquí no debe esperar
+# otras tareas de stage_executor: con el pool lleno se bloquearía
+stage_executor = ThreadPoolExecutor(max_workers=int(os.getenv('PIPELINE_STAGE_WORKERS', '8')),
+                                    thread_name_prefix="stage")
+
+# Llamadas cortas y bloqueantes: pika, psycopg2, health checks
+io_executor = ThreadPoolExecutor(max_workers=int(os.getenv('IO_EXECUTOR_WORKERS', '16')),
+                                 thread_name_prefix="io")
+
+# Peticiones HTTP a OpenWeather y Places que una etapa lanza en paralelo y
+# espera. Nunca esperan tareas de otro executor; sí pueden encolar trabajo
+# sin esperarlo (gazetteer.remember guarda en Postgres vía io_executor)
+http_executor = ThreadPoolExecutor(max_workers=int(os.getenv('HTTP_EXECUTOR_WORKERS', '16')),
+                                   thread_name_prefix="http")
+
+
+async def run_blocking(executor: ThreadPoolExecutor, fn, *args, **kwargs):
+    """
+    Ejecuta una función bloqueante en el executor dado sin frenar el event loop.
+    La función ve las contextvars de quien llama (p. ej. el desglose de
+    tiempos de la petición).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, partial(context.run, fn, *args, **kwargs))
+
+
+def submit(executor: ThreadPoolExecutor, fn, *args, **kwargs):
+    """
+    executor.submit conservando las contextvars de quien llama.
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def shutdown_executors() -> None:
+    agent_executor.shutdown(wait=False, cancel_futures=True)
+    stage_executor.shutdown(wait=False, cancel_futures=True)
+    http_executor.shutdown(wait=False, cancel_futures=True)
+    io_executor.shutdown(wait=True)
@@ -0,0 +1,194 @@
+import difflib
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from cache import normalize_text
+from connections import get_postgres_connection
+from executors import io_executor, submit
+from geo import distance_km
+
+# Parecido mínimo (difflib) para sugerir un nombre conocido
+GAZETTEER_FUZZY_CUTOFF = float(os.getenv('GAZETTEER_FUZZY_CUTOFF', '0.85'))
+# Distancia máxima entre la sugerencia y lo que responde /weather para darla
+# por buena
+GAZETTEER_CONFIRM_KM = float(os.getenv('GAZETTEER_CONFIRM_KM', '25'))
+
+
+class Place(NamedTuple):
+    name: str
+    country: Optional[str]
+    latitude: float
+    longitude: float
+
+
+class Gazetteer:
+    """
+    Índice local de ciudad o código postal -> coordenadas. Se alimenta con las
+    respuestas de OpenWeather que ya se reciben (remember) y se guarda en la
+    tabla gazetteer; las consultas son un dict en memoria, sin red.
+
+    Las llaves son textos normalizados ("tunja", "tunja,co", "150001").
+
+    La búsqueda aproximada (suggest) no se usa sola: un nombre parecido puede
+    ser otra ciudad ("santa maria" / "santa marta"), así que quien la use debe
+    confirmarla contra /weather con confirm().
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, Place] = {}
+        # Llaves agrupadas por su primera letra: la búsqueda aproximada solo
+        # compara contra ese grupo
+        self._by_initial: Dict[str, List[str]] = defaultdict(list)
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.fuzzy_hits = 0
+        self.fuzzy_rejected = 0
+        self.misses = 0
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with get_postgres_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT query_key, name, country, latitude, longitude FROM gazetteer;")
+                    rows = cursor.fetchall()
+                    cursor.close()
+                for key, name, country, latitude, longitude in rows:
+                    self._add(key, Place(name, country, latitude, longitude))
+                print(f"Gazetteer cargado: {len(rows)} nombres")
+            except Exception as e:
+                print(f"Error cargando gazetteer: {e}")
+            # Si Postgres no responde se sigue solo con lo que se aprenda
+            self._loaded = True
+
+    def _add(self, key: str, place: Place) -> None:
+        if key not in self._entries:
+            self._by_initial[key[:1]].append(key)
+        self._entries[key] = place
+
+    def lookup(self, query: str) -> Optional[Tuple[float, float]]:
+        """
+        (lat, lon) para una ciudad o código postal, o None si no se conoce.
+        Prueba la llave exacta y luego el nombre sin país (si el país
+        coincide).
+        """
+        if not query:
+            return None
+        self._ensure_loaded()
+
+        key = normalize_text(query)
+        name, _, country = key.partition(',')
+        place = self._entries.get(key)
+        if place is None and country:
+            place = self._matching_country(self._entries.get(name), country)
+        if place is not None:
+            self.hits += 1
+            return place.latitude, place.longitude
+
+        self.misses += 1
+        return None
+
+    def suggest(self, query: str) -> Optional[Place]:
+        """
+        Lugar conocido con el nombre más parecido a `query` (mismo país si se
+        indica), o None. Hay que confirmarlo antes de usarlo.
+        """
+        if not query:
+            return None
+        self._ensure_loaded()
+
+        key = normalize_text(query)
+        country = key.partition(',')[2]
+        candidates = self._by_initial.get(key[:1], [])
+        for match in difflib.get_close_matches(key, candidates, n=3, cutoff=GAZETTEER_FUZZY_CUTOFF):
+            place = self._matching_country(self._entries[match], country)
+            if place is not None:
+                return place
+        return None
+
+    def confirm(self, query: str, place: Place, latitude: Optional[float], longitude: Optional[float]) -> bool:
+        """
+        True si la sugerencia `place` para `query` queda a menos de
+        GAZETTEER_CONFIRM_KM de las coordenadas que dio /weather.
+        """
+        if latitude is None or longitude is None:
+            confirmed = False
+        else:
+            confirmed = distance_km(place.latitude, place.longitude, latitude, longitude) <= GAZETTEER_CONFIRM_KM
+        if confirmed:
+            self.fuzzy_hits += 1
+        else:
+            self.fuzzy_rejected += 1
+            print(f"Gazetteer: {query!r} no es {place.name} ({place.country}), /weather dio {latitude}, {longitude}")
+        return confirmed
+
+    @staticmethod
+    def _matching_country(place: Optional[Place], country: str) -> Optional[Place]:
+        if place is None or not country or not place.country:
+            return place
+        return place if place.country.lower() == country else None
+
+    def remember(self, query: str, name: str, country: Optional[str], latitude: float, longitude: float) -> None:
+        """
+        Registra lo que respondió OpenWeather para `query`. Las llaves nuevas
+        o con coordenadas distintas se guardan en Postgres en segundo plano.
+
+        El nombre sin país ("cordoba") solo se escribe cuando `query` tampoco
+        lo traía: una consulta "Cordoba, ES" no debe cambiar a qué ciudad
+        lleva "Cordoba" a secas.
+        """
+        self._ensure_loaded()
+        place = Place(name, country, float(latitude), float(longitude))
+        query_key = normalize_text(query)
+        keys = {query_key}
+        if ',' not in query_key:
+            keys.add(normalize_text(name))
+        if country:
+            keys.add(f"{normalize_text(name)},{country.lower()}")
+
+        with self._lock:
+            changed = [key for key in keys if key and self._entries.get(key) != place]
+            for key in changed:
+                self._add(key, place)
+        if changed:
+            submit(io_executor, self._persist, changed, place)
+
+    @staticmethod
+    def _persist(keys: List[str], place: Place) -> None:
+        try:
+            with get_postgres_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                                   INSERT INTO gazetteer (query_key, name, country, latitude, longitude)
+                                   VALUES (%s, %s, %s, %s, %s)
+                                   ON CONFLICT (query_key) DO UPDATE
+                                       SET name = EXCLUDED.name,
+                                           country = EXCLUDED.country,
+                                           latitude = EXCLUDED.latitude,
+                                           longitude = EXCLUDED.longitude,
+                                           updated_at = CURRENT_TIMESTAMP;
+                                   """, [(key, place.name, place.country, place.latitude, place.longitude)
+                                         for key in keys])
+                conn.commit()
+                cursor.close()
+        except Exception as e:
+            print(f"Error guardando en gazetteer: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "fuzzy_hits": self.fuzzy_hits,
+            "fuzzy_rejected": self.fuzzy_rejected,
+            "misses": self.misses
+        }
+
+
+gazetteer = Gazetteer()
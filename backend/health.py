@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict
+
+from api_services import test_postgres, test_rabbitmq
+
+HEALTH_INTERVAL = float(os.getenv('HEALTH_INTERVAL', '10'))
+# Un resultado más viejo que esto (el hilo de probes se trabó) no cuenta como sano
+HEALTH_MAX_AGE = float(os.getenv('HEALTH_MAX_AGE', str(HEALTH_INTERVAL * 3)))
+
+
+class HealthMonitor:
+    """
+    Revisa las dependencias en un hilo propio cada `interval` segundos y
+    guarda el último resultado; los endpoints de salud solo leen ese
+    resultado, sin abrir conexiones.
+
+    Las probes son de solo lectura: no publican mensajes ni escriben en la
+    base de datos.
+    """
+
+    def __init__(self, probes: Dict[str, Callable[[], str]], interval: float = HEALTH_INTERVAL,
+                 max_age: float = HEALTH_MAX_AGE):
+        self.probes = probes
+        self.interval = interval
+        self.max_age = max_age
+        self.results: Dict[str, Dict[str, Any]] = {
+            name: {"ok": False, "detail": "Sin verificar", "checked_at": None, "latency_ms": None}
+            for name in probes
+        }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="health-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            self.check_now()
+            self._stop.wait(self.interval)
+
+    def check_now(self) -> None:
+        for name, probe in self.probes.items():
+            start = time.perf_counter()
+            try:
+                detail = probe()
+            except Exception as e:
+                detail = f"Error: {e}"
+            # Se reemplaza el dict completo, así quien lee nunca ve uno a medias
+            self.results[name] = {
+                "ok": "Todo bien" in detail,
+                "detail": detail,
+                "checked_at": time.time(),
+                "latency_ms": round((time.perf_counter() - start) * 1000, 1)
+            }
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_ready(self) -> bool:
+        now = time.time()
+        return all(
+            result["ok"] and result["checked_at"] is not None and now - result["checked_at"] <= self.max_age
+            for result in self.results.values()
+        )
+
+
+health_monitor = HealthMonitor({
+    "postgres": test_postgres,
+    "rabbitmq": test_rabbitmq
+})
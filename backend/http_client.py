@@ -0,0 +1,44 @@
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (conexión, lectura) en segundos
+HTTP_TIMEOUT = (float(os.getenv('HTTP_CONNECT_TIMEOUT', '3')), float(os.getenv('HTTP_READ_TIMEOUT', '10')))
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '20'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+
+_session = None
+_lock = threading.Lock()
+
+
+def build_session() -> requests.Session:
+    """
+    Sesión con conexiones keep-alive reutilizables y reintentos con backoff
+    para errores transitorios (429 y 5xx).
+    """
+    retry = Retry(
+        total=HTTP_RETRIES,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        # searchNearby es un POST pero no modifica nada, se puede repetir
+        allowed_methods=frozenset(['GET', 'POST']),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = build_session()
+    return _session
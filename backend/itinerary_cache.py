@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from cache import normalize_text
+from connections import get_postgres_connection
+from metrics import span
+
+ITINERARY_CACHE_ENABLED = os.getenv('ITINERARY_CACHE', 'on') == 'on'
+# El pronóstico cambia a lo largo del día; 6 horas evita servir itinerarios
+# con un clima muy distinto al actual
+ITINERARY_CACHE_TTL = int(os.getenv('ITINERARY_CACHE_TTL', str(6 * 60 * 60)))
+
+
+def request_key(city: str, days: int, interests: List[str]) -> str:
+    """
+    Hash canónico de la petición: ciudad normalizada, número de días, conjunto
+    de intereses (sin orden ni repetidos) y el día en que empieza la ventana
+    del pronóstico.
+    """
+    canonical = {
+        "city": normalize_text(city or ""),
+        "days": days,
+        "interests": sorted({normalize_text(i) for i in interests if i}),
+        "forecast_start": datetime.now(timezone.utc).date().isoformat()
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_cached_itinerary(city: str, days: int, interests: List[str]) -> Optional[Dict[str, Any]]:
+    """
+    Devuelve el itinerario guardado para la petición (y suma el hit) o None
+    si no hay una entrada vigente.
+    """
+    if not ITINERARY_CACHE_ENABLED:
+        return None
+    try:
+        with span("itinerary_cache.lookup"), get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                           UPDATE itinerary_cache
+                           SET hits = hits + 1, last_hit_at = CURRENT_TIMESTAMP
+                           WHERE request_hash = %s AND expires_at > CURRENT_TIMESTAMP
+                           RETURNING itinerary_text, weather, tourism;
+                           """, (request_key(city, days, interests),))
+            row = cursor.fetchone()
+            conn.commit()
+            cursor.close()
+    except Exception as e:
+        print(f"Error leyendo itinerary_cache: {e}")
+        return None
+
+    if row is None:
+        return None
+    print(f"Itinerario servido desde cache para {city}")
+    return {"itinerary": row[0], "weather": row[1], "tourism": row[2]}
+
+
+def store_itinerary(city: str, days: int, interests: List[str], result: Dict[str, Any]) -> None:
+    if not ITINERARY_CACHE_ENABLED:
+        return
+    try:
+        with get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                           INSERT INTO itinerary_cache (request_hash, city, days, interests, itinerary_text,
+                                                        weather, tourism, expires_at)
+                           VALUES (%s, %s, %s, %s::jsonb, %s, %s::jsonb, %s::jsonb,
+                                   CURRENT_TIMESTAMP + make_interval(secs => %s))
+                           ON CONFLICT (request_hash) DO UPDATE
+                               SET itinerary_text = EXCLUDED.itinerary_text,
+                                   weather = EXCLUDED.weather,
+                                   tourism = EXCLUDED.tourism,
+                                   expires_at = EXCLUDED.expires_at,
+                                   created_at = CURRENT_TIMESTAMP;
+                           """, (request_key(city, days, interests), city, days,
+                                 json.dumps(interests, ensure_ascii=False), result["itinerary"],
+                                 json.dumps(result["weather"], ensure_ascii=False),
+                                 json.dumps(result["tourism"], ensure_ascii=False), ITINERARY_CACHE_TTL))
+            conn.commit()
+            cursor.close()
+    except Exception as e:
+        print(f"Error guardando en itinerary_cache: {e}")
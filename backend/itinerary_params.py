@@ -0,0 +1,15 @@
+import re
+
+# Sin dependencias: persistence.py lo usa sin cargar los agentes de pipeline.py
+
+
+def validate_time_string(time_str: str) -> int:
+    try:
+        days = int(time_str)
+        return days
+    except ValueError:
+        match = re.search(r'\d+', time_str)
+        if match:
+            return int(match.group())
+        else:
+            return 5
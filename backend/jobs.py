@@ -0,0 +1,281 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import pika
+
+from connections import RABBITMQ_URL
+
+# Exchange fanout de los eventos de los jobs: cada réplica de la API lo
+# escucha con su propia cola exclusiva y recibe todos los eventos
+ITINERARY_EXCHANGE = os.getenv('ITINERARY_EXCHANGE', 'itinerary_events')
+# worker: los mensajes van a RabbitMQ y worker.py reporta el avance por
+# ITINERARY_EXCHANGE; inline: el pipeline corre en el proceso de la API
+JOB_RUNNER = os.getenv('JOB_RUNNER', 'worker')
+# Los jobs terminados se olvidan después de JOB_TTL segundos
+JOB_TTL = int(os.getenv('JOB_TTL', '3600'))
+JOB_MAX_ENTRIES = int(os.getenv('JOB_MAX_ENTRIES', '10000'))
+JOB_LONG_POLL_MAX = float(os.getenv('JOB_LONG_POLL_MAX', '30'))
+# Un job sin novedades en JOB_DEADLINE segundos se da por perdido (mensaje
+# huérfano, worker caído) y pasa a failed
+JOB_DEADLINE = int(os.getenv('JOB_DEADLINE', '300'))
+# Cada JOB_HEARTBEAT segundos el runner avisa que sigue con sus jobs, aunque
+# no termine ninguna etapa: generar con Ollama puede tardar minutos
+JOB_HEARTBEAT = float(os.getenv('JOB_HEARTBEAT', '30'))
+
+# Etapas (spans de metrics) que se reportan como progreso, en orden
+JOB_STAGES = ("weather", "tourism.categories", "tourism.search", "tourism.places", "ollama.generate")
+FINAL_STATUSES = ("done", "failed")
+
+
+class Job:
+    """
+    Estado de un itinerario pedido por /sendItineraryInfo. `version` sube con
+    cada cambio; es lo que comparan el long-poll y el canal SSE.
+    """
+    __slots__ = ("job_id", "city", "status", "stage", "stages_done", "version", "itinerary", "error", "created_at",
+                 "updated_at")
+
+    def __init__(self, job_id: str, city: str):
+        self.job_id = job_id
+        self.city = city
+        self.status = "queued"
+        self.stage = None
+        # Bit i encendido = JOB_STAGES[i] terminada (las etapas pueden
+        # terminar en otro orden: categorías corre junto con el clima)
+        self.stages_done = 0
+        self.version = 0
+        self.itinerary = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def snapshot(self) -> Dict[str, Any]:
+        done = [stage for i, stage in enumerate(JOB_STAGES) if self.stages_done >> i & 1]
+        data = {
+            "job_id": self.job_id,
+            "city": self.city,
+            "status": self.status,
+            "stage": self.stage,
+            "stages_done": done,
+            "progress": 1.0 if self.status == "done" else round(len(done) / (len(JOB_STAGES) + 1), 2),
+            "version": self.version
+        }
+        if self.itinerary is not None:
+            data["itinerary"] = self.itinerary
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+class JobStore:
+    """
+    Jobs en memoria. Se actualizan desde cualquier hilo (consumidor de
+    ITINERARY_EXCHANGE, executors) y despiertan a quienes esperan en el event
+    loop con call_soon_threadsafe.
+
+    Los jobs sin terminar que llevan `deadline` segundos sin novedades ni
+    señales de vida (touch) se marcan failed cuando alguien los consulta
+    (get, wait, stats).
+    """
+
+    def __init__(self, ttl: int = JOB_TTL, max_entries: int = JOB_MAX_ENTRIES, deadline: int = JOB_DEADLINE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.deadline = deadline
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._waiters: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def create(self, city: str) -> Job:
+        job = Job(str(uuid.uuid4()), city)
+        with self._lock:
+            self._evict(job.created_at)
+            self._jobs[job.job_id] = job
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            waiters = self._expire(job, time.time())
+        self._wake(waiters)
+        return job
+
+    def update(self, job_id: str, status: str, stage: Optional[str] = None, itinerary: Optional[str] = None,
+               error: Optional[str] = None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            # Eventos de jobs olvidados o de otra instancia de la API
+            if job is None or job.status in FINAL_STATUSES:
+                return
+            job.status = status
+            if stage in JOB_STAGES:
+                job.stage = stage
+                job.stages_done |= 1 << JOB_STAGES.index(stage)
+            job.itinerary = itinerary if itinerary is not None else job.itinerary
+            job.error = error
+            job.version += 1
+            job.updated_at = time.time()
+            waiters = self._waiters.pop(job_id, [])
+        self._wake(waiters)
+
+    def touch(self, job_id: str) -> None:
+        """Señal de vida del runner: aplaza el plazo sin cambiar la versión."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status not in FINAL_STATUSES:
+                job.updated_at = time.time()
+
+    def progress(self, job_id: str, stage: str) -> None:
+        if stage in JOB_STAGES:
+            self.update(job_id, "running", stage=stage)
+
+    async def wait(self, job_id: str, version: int, timeout: float) -> Optional[Job]:
+        """
+        Espera hasta `timeout` segundos a que el job pase de `version` o
+        termine, y lo devuelve (None si no existe).
+        """
+        event = asyncio.Event()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            waiters = self._expire(job, time.time())
+            if job is None or job.version != version or job.status in FINAL_STATUSES:
+                self._wake(waiters)
+                return job
+            self._waiters.setdefault(job_id, []).append((asyncio.get_running_loop(), event))
+            # Despierta a tiempo para marcar el job si vence su plazo
+            timeout = min(timeout, job.updated_at + self.deadline - time.time())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                waiters = self._waiters.get(job_id, [])
+                waiters[:] = [w for w in waiters if w[1] is not event]
+        return self.get(job_id)
+
+    def _expire(self, job: Optional[Job], now: float) -> list:
+        """
+        Con el lock tomado: marca failed el job si venció su plazo y devuelve
+        los waiters que hay que despertar.
+        """
+        if job is None or job.status in FINAL_STATUSES or now - job.updated_at < self.deadline:
+            return []
+        job.status = "failed"
+        job.error = f"Sin novedades del itinerario en {self.deadline} s"
+        job.version += 1
+        job.updated_at = now
+        return self._waiters.pop(job.job_id, [])
+
+    @staticmethod
+    def _wake(waiters: list) -> None:
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    def _evict(self, now: float) -> None:
+        while self._jobs:
+            job_id, oldest = next(iter(self._jobs.items()))
+            if len(self._jobs) < self.max_entries and now - oldest.updated_at < self.ttl:
+                break
+            del self._jobs[job_id]
+            self._waiters.pop(job_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        now = time.time()
+        waiters = []
+        with self._lock:
+            counts = {"jobs": len(self._jobs)}
+            for job in self._jobs.values():
+                waiters += self._expire(job, now)
+                counts[job.status] = counts.get(job.status, 0) + 1
+        self._wake(waiters)
+        return counts
+
+
+job_store = JobStore()
+
+
+def apply_job_event(job_id: Optional[str], body: bytes) -> None:
+    """
+    Aplica un evento de ITINERARY_EXCHANGE: progreso (`status` running con su
+    `stage`), señal de vida (`status` heartbeat), resultado (`status` done con
+    `itinerary`) o error.
+    """
+    if job_id is None:
+        return
+    event = json.loads(body.decode())
+    if event.get("status") == "heartbeat":
+        job_store.touch(job_id)
+        return
+    job_store.update(job_id, event.get("status", "done"), stage=event.get("stage"),
+                     itinerary=event.get("itinerary"), error=event.get("error"))
+
+
+class JobEventConsumer:
+    """
+    Hilo que escucha ITINERARY_EXCHANGE y actualiza job_store. Si se pierde
+    la conexión vuelve a intentar cada `retry_delay` segundos.
+
+    Cada réplica de la API enlaza al exchange fanout su propia cola
+    exclusiva, que RabbitMQ borra al cerrarse la conexión: todas reciben
+    todos los eventos, y los que llegan mientras una réplica está
+    desconectada se pierden (JOB_DEADLINE cierra esos jobs).
+    """
+
+    def __init__(self, url: str = RABBITMQ_URL, exchange: str = ITINERARY_EXCHANGE, retry_delay: float = 5):
+        self.url = url
+        self.exchange = exchange
+        self.retry_delay = retry_delay
+        self._stop = threading.Event()
+        self._connection = None
+        self._channel = None
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="job-events", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        connection, channel = self._connection, self._channel
+        if connection is not None and channel is not None and connection.is_open:
+            try:
+                connection.add_callback_threadsafe(channel.stop_consuming)
+            except Exception:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=self.retry_delay)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._connection = pika.BlockingConnection(pika.URLParameters(self.url))
+                self._channel = self._connection.channel()
+                self._channel.exchange_declare(exchange=self.exchange, exchange_type='fanout', durable=True)
+                queue = self._channel.queue_declare(queue='', exclusive=True).method.queue
+                self._channel.queue_bind(queue=queue, exchange=self.exchange)
+                self._channel.basic_consume(
+                    queue=queue, auto_ack=True,
+                    on_message_callback=lambda ch, method, properties, body: self._on_message(properties, body)
+                )
+                self._channel.start_consuming()
+                self._connection.close()
+            except Exception as e:
+                if not self._stop.is_set():
+                    print(f"Error consumiendo {self.exchange}: {e}")
+            self._stop.wait(self.retry_delay)
+
+    def _on_message(self, properties, body) -> None:
+        try:
+            apply_job_event(properties.correlation_id, body)
+        except Exception as e:
+            print(f"Evento de job inválido: {e}")
+
+
+job_events = JobEventConsumer()
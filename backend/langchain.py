@@ -1,18 +1,37 @@
+import os
+import time
+from typing import Any, List
+
 from langchain_ollama import ChatOllama
 
+from metrics import record, record_generation
+
+OLLAMA_BASE_URL = os.getenv('OLLAMA_BASE_URL', 'http://ollama:11434')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'llama3.1')
+# Tiempo que Ollama mantiene el modelo en memoria después de cada petición
+# ("30m", "1h", segundos como "600" o "-1" para no descargarlo nunca)
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
 
-def generar_itinerario(json_data: str):
-    """
-    Genera un itinerario turístico basado en el JSON proporcionado.
-    El JSON debe contener la información de ciudad, fechas y lugares.
-    """
-    llm = ChatOllama(
-        model="llama3.1",
-        base_url="http://ollama:11434",
-        temperature=0,
-    )
 
-    messages = [
+def _parse_keep_alive(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+# Un solo cliente para todo el proceso: reutiliza las conexiones HTTP a
+# Ollama entre peticiones y es seguro de usar desde varios hilos
+llm = ChatOllama(
+    model=OLLAMA_MODEL,
+    base_url=OLLAMA_BASE_URL,
+    temperature=0,
+    keep_alive=_parse_keep_alive(OLLAMA_KEEP_ALIVE),
+)
+
+
+def _build_messages(json_data: str):
+    return [
         (
             "system",
             """
@@ -30,7 +49,7 @@ def generar_itinerario(json_data: str):
             - Tarde: [Actividad + lugar turístico + clima esperado]  
             - Noche: [Actividad + lugar turístico + clima esperado]
 
-            (Repite para cada fecha única en los pronósticos)
+            (Repite para cada fecha en "days")
 
             🌡️ Clima esperado: [Resumen general]
 
@@ -43,10 +62,67 @@ def generar_itinerario(json_data: str):
         ("human", json_data),
     ]
 
-    ai_msg = llm.invoke(messages)
+
+def generar_itinerario(json_data: str):
+    """
+    Genera un itinerario turístico basado en el JSON proporcionado.
+    El JSON debe contener la información de ciudad, fechas y lugares.
+    """
+    start = time.perf_counter()
+    ai_msg = llm.invoke(_build_messages(json_data))
+    record_generation(ai_msg, time.perf_counter() - start)
+    return ai_msg
+
+
+async def generar_itinerario_async(json_data: str):
+    """
+    Igual que generar_itinerario pero sin bloquear el event loop mientras
+    Ollama genera.
+    """
+    start = time.perf_counter()
+    ai_msg = await llm.ainvoke(_build_messages(json_data))
+    record_generation(ai_msg, time.perf_counter() - start)
     return ai_msg
 
 
+async def generar_itinerario_stream(json_data: str):
+    """
+    Genera el itinerario devolviendo los fragmentos de texto a medida que
+    Ollama los produce.
+    """
+    start = time.perf_counter()
+    first_token = True
+    async for chunk in llm.astream(_build_messages(json_data)):
+        if chunk.content:
+            if first_token:
+                record("ollama.first_token", time.perf_counter() - start)
+                first_token = False
+            yield chunk.content
+        if chunk.usage_metadata:
+            # El último fragmento trae el conteo de tokens
+            record_generation(chunk, time.perf_counter() - start)
+
+
+def generar_itinerarios(json_data_list: List[str]) -> List[Any]:
+    """
+    Genera varios itinerarios a la vez con peticiones paralelas a Ollama
+    (requiere OLLAMA_NUM_PARALLEL > 1 en el servidor). Devuelve el texto de
+    cada uno, o la excepción en la posición del que falló.
+    """
+    start = time.perf_counter()
+    responses = llm.batch(
+        [_build_messages(json_data) for json_data in json_data_list],
+        config={"max_concurrency": len(json_data_list)},
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    record("ollama.generate_batch", elapsed)
+    for response in responses:
+        if not isinstance(response, Exception):
+            record_generation(response, elapsed)
+    return [r if isinstance(r, Exception) else extract_text(r) for r in responses]
+
+
 def extract_text(response):
     return response.content
 
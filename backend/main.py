@@ -1,23 +1,52 @@
+import asyncio
 import json
 import os
-import re
+import time
+from contextlib import asynccontextmanager
+from typing import List
 
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse
-
-from api_services import test_postgres, test_rabbitmq, send_message_to_rabbit, read_messages_from_rabbit
-from connections import get_postgres_connection
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+
+from api_services import send_message_to_rabbit, send_messages_to_rabbit, read_messages_from_rabbit
+from cache import cache_stats
+from connections import postgres_pool, rabbitmq_pool
+from executors import agent_executor, io_executor, run_blocking, shutdown_executors
+from gazetteer import gazetteer
+from health import health_monitor
+from itinerary_cache import get_cached_itinerary, request_key, store_itinerary
+from itinerary_params import validate_time_string
+from jobs import FINAL_STATUSES, JOB_HEARTBEAT, JOB_LONG_POLL_MAX, JOB_RUNNER, job_events, job_store
+from metrics import http_request_seconds, on_stage, render_metrics, server_timing, start_breakdown
 from models import MessageRequest, MessageRequestForWeather, MessageRequestForTourism, HealthResponse, MessageItinerary
+from persistence import close_persistence, enqueue_itinerary, persistence_stats, save_to_postgres
+from pipeline import itinerary_flights, normalize_interests, run_itinerary_pipeline_async, stream_itinerary_pipeline
+from singleflight import single_flight_stats
 from tourism_agent import tourism_agent
 from weather_agent import weather_agent
-from langchain import extract_text, generar_itinerario
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    health_monitor.start()
+    if JOB_RUNNER == 'worker':
+        job_events.start()
+    yield
+    health_monitor.stop()
+    job_events.stop()
+    shutdown_executors()
+    close_persistence()
+    rabbitmq_pool.close()
+    postgres_pool.close()
+
 
 app = FastAPI(
     title="SmartRoute",
     description="Generador de itinerarios basado en el clima y preferencias turísticas",
-    version="1.0.0-test"
+    version="1.0.0-test",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -29,156 +58,296 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def stage_timing(request: Request, call_next):
+    # Las etapas que se midan durante la petición (en este task o en los
+    # executors) se agregan a esta lista y salen en el header Server-Timing
+    breakdown = start_breakdown()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    # La plantilla de la ruta (/itineraries/{job_id}), no la URL con el id
+    route = request.scope.get("route")
+    path = route.path if route is not None and response.status_code != 404 else "not_found"
+    http_request_seconds.observe(elapsed, path)
+    response.headers["Server-Timing"] = server_timing(breakdown + [("total", elapsed)])
+    return response
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    postgres_status = test_postgres()
-    rabbit_status = test_rabbitmq()
-
-    status = "healthy" if "Todo bien" in postgres_status and "Todo bien" in rabbit_status else "degraded"
+    # Último resultado de las probes en segundo plano (health.py)
+    results = health_monitor.results
 
     return {
-        "status": status,
-        "postgres": postgres_status,
-        "rabbitmq": rabbit_status
+        "status": "healthy" if health_monitor.is_ready() else "degraded",
+        "postgres": results["postgres"]["detail"],
+        "rabbitmq": results["rabbitmq"]["detail"]
     }
 
 
-def validate_time_string(time_str: str) -> int:
-    try:
-        days = int(time_str)
-        return days
-    except ValueError:
-        match = re.search(r'\d+', time_str)
-        if match:
-            return int(match.group())
-        else:
-            return 5
+@app.get("/health/live")
+async def liveness():
+    """
+    El proceso responde y el hilo de probes sigue corriendo; no depende de
+    Postgres ni de RabbitMQ.
+    """
+    alive = health_monitor.is_alive()
+    return JSONResponse({"status": "alive" if alive else "dead"}, status_code=200 if alive else 503)
 
 
-def extract_coordinates(agent_result):
-    try:
-        lat = float(agent_result["current"]["coordinates"]["lat"])
-        lon = float(agent_result["current"]["coordinates"]["lon"])
-        print(f"Coordenadas extraídas: lat={lat}, lon={lon}")
-        return [lat, lon]
-    except (KeyError, TypeError, ValueError) as e:
-        print(f"Error extrayendo coordenadas: {e}")
-        return [None, None]
+@app.get("/health/ready")
+async def readiness():
+    """
+    Listo para recibir tráfico: todas las dependencias sanas en la última
+    revisión y el resultado no está vencido.
+    """
+    ready = health_monitor.is_ready()
+    return JSONResponse(
+        {"status": "ready" if ready else "not_ready", "checks": health_monitor.results},
+        status_code=200 if ready else 503
+    )
 
 
-@app.get("/getItineraryInfo", response_class=PlainTextResponse)
-async def get_itinerary_info():
-    final_result = []
+async def save_itinerary(city, time, interests, result):
+    # La respuesta no espera a Postgres: la cache se llena en io_executor y el
+    # itinerario pasa a la cola de write-behind
+    io_executor.submit(store_itinerary, city, validate_time_string(time), interests, result)
 
-    weather_messages = read_messages_from_rabbit(1, os.getenv('WEATHER_QUEUE'))
+    saved = dict(
+        city=city,
+        time_str=time,
+        weather_data=result["weather"],
+        tourism_data=result["tourism"],
+        itinerary_text=result["itinerary"]
+    )
+    if enqueue_itinerary(**saved):
+        return
 
-    agent_result = None
-    weather_result = None
-    from datetime import datetime
-    tourism_result = None
-    city = None
-    time = None
+    # Modo direct o cola llena: se guarda antes de responder
+    print("Voy a guardar")
+    await run_blocking(io_executor, save_to_postgres, **saved)
+    print("Ya guarde")
 
-    for message in weather_messages:
-        print(f"Mensaje? {message} \n")
-        city = message["city"]
-        time = message["time"]
-        days = validate_time_string(time)
-        print("Agente del clima ha empezado a las " + datetime.now().strftime("%H:%M:%S"))
-        weather_result = weather_agent.run_weather_forecast(city, days)
-        print("Agente del clima ha terminado a las " + datetime.now().strftime("%H:%M:%S"))
-    lat, lon = extract_coordinates(weather_result)
 
-    print("Resultado del agente del clima:\n\n")
-    print(weather_result)
-    final_result.append(weather_result)
+async def compute_itinerary(city, time, interests):
+    """
+    Cache de itinerarios o pipeline completo. Las peticiones idénticas que
+    llegan mientras otra se calcula esperan ese mismo resultado, y solo la
+    primera lo guarda.
+    """
+    days = validate_time_string(time)
 
-    tourism_messages = read_messages_from_rabbit(1, os.getenv('TOURISM_QUEUE'))
+    async def compute():
+        cached = await run_blocking(io_executor, get_cached_itinerary, city, days, interests)
+        if cached is not None:
+            return cached
+        result = await run_itinerary_pipeline_async(city, time, interests)
+        await save_itinerary(city, time, interests, result)
+        return result
 
-    for message in tourism_messages:
-        interests = message["interests"]
+    return await itinerary_flights.do_async(request_key(city, days, interests), compute)
 
-        if not isinstance(interests, list):
-            if isinstance(interests, str):
-                interests = [interests]
-            else:
-                interests = []
 
-        print("Agente de turismo ha empezado a las " + datetime.now().strftime("%H:%M:%S"))
-        tourism_result = tourism_agent.run_tourism_category_selector(
-            user_interests=interests,
-            latitude=lat,
-            longitude=lon,
-            weather=final_result
-        )
+@app.get("/getItineraryInfo", response_class=PlainTextResponse)
+async def get_itinerary_info(job_id: str):
+    """
+    Espera a que termine el job creado por /sendItineraryInfo y devuelve el
+    itinerario. No lee WEATHER_QUEUE ni TOURISM_QUEUE: esas colas las consume
+    el worker.
+    """
+    job = job_store.get(job_id)
+    while job is not None and job.status not in FINAL_STATUSES:
+        job = await job_store.wait(job_id, job.version, JOB_LONG_POLL_MAX)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+    if job.status == "failed":
+        raise HTTPException(status_code=502, detail=job.error or "No se pudo generar el itinerario")
 
-        print("Agente de turismo ha terminado a las " + datetime.now().strftime("%H:%M:%S"))
-        print("Voy a guardar")
-        print("Ya guardé")
-        final_result.append(tourism_result)
+    return job.itinerary
 
-        print("Resultado final de los agentes:\n\n")
-        print(final_result)
 
-    print("\n\n\n" + str(final_result) + "\n\n\n")
+@app.get("/streamItineraryInfo")
+async def stream_itinerary_info(city: str, time: str, interests: List[str] = Query(default=[])):
+    """
+    Genera el itinerario en este proceso y envía el texto por fragmentos a
+    medida que Ollama lo genera; se guarda en Postgres al terminar. Los datos
+    llegan en la URL (?city=...&time=...&interests=...), no por las colas.
+    """
+    interests = normalize_interests(interests)
+    cached = await run_blocking(io_executor, get_cached_itinerary, city, validate_time_string(time), interests)
+    if cached is not None:
+        return PlainTextResponse(cached["itinerary"])
 
-    print("No se que poner " + "\n\n\n\n\n\n\n")
+    async def on_complete(result):
+        await save_itinerary(city, time, interests, result)
 
-    json_string = json.dumps(final_result, ensure_ascii=False)
-    out = extract_text(generar_itinerario(json_string))
+    return StreamingResponse(
+        stream_itinerary_pipeline(city, time, interests, on_complete=on_complete),
+        media_type="text/plain; charset=utf-8"
+    )
 
-    print("Aca va la salida")
-    print(out)
 
-    print("Voy a guardar")
-    save_to_postgres(
-        city=city,
-        time_str=time,
-        weather_data=weather_result,
-        tourism_data=tourism_result,
-        itinerary_text=out
-    )
-    print("Ya guarde")
+# Referencias a los jobs inline en curso para que el GC no los cancele
+_inline_jobs = set()
 
-    print(type(out))
 
-    return out
+async def run_job_inline(job_id, city, time, interests):
+    """
+    JOB_RUNNER=inline: ejecuta el itinerario del job en este proceso; cada
+    etapa terminada se reporta como progreso del job.
+    """
+    start_breakdown()
+    on_stage(lambda stage, seconds: job_store.progress(job_id, stage))
+    job_store.update(job_id, "running")
+    heartbeat = asyncio.create_task(send_job_heartbeats(job_id))
+    try:
+        result = await compute_itinerary(city, time, interests)
+    except Exception as e:
+        print(f"Error generando itinerario {job_id}: {e}")
+        job_store.update(job_id, "failed", error=str(e))
+        return
+    finally:
+        heartbeat.cancel()
+    job_store.update(job_id, "done", itinerary=result["itinerary"])
+
+
+async def send_job_heartbeats(job_id):
+    # Como el worker: el job sigue vivo mientras se genera sin terminar etapas
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT)
+        job_store.touch(job_id)
 
 
 @app.post("/sendItineraryInfo")
 async def send_itinerary_info(message: MessageItinerary):
+    """
+    Crea un job con los datos de esta petición y responde de inmediato con su
+    id; el resultado se consulta en /itineraries/{job_id}, llega por
+    /itineraries/{job_id}/events o se espera con /getItineraryInfo?job_id=.
+    """
     print(f"Prueba {message.city}")
     print(f"{message.time}")
     print(f"{message.interests}")
+    job = job_store.create(message.city)
+    response = {
+        "job_id": job.job_id,
+        "correlation_id": job.job_id,
+        "status_url": f"/itineraries/{job.job_id}",
+        "events_url": f"/itineraries/{job.job_id}/events",
+        "status": "Messages sent successfully"
+    }
+
+    if JOB_RUNNER == 'inline':
+        task = asyncio.create_task(run_job_inline(
+            job.job_id, message.city, message.time, normalize_interests(message.interests)
+        ))
+        _inline_jobs.add(task)
+        task.add_done_callback(_inline_jobs.discard)
+        return response
+
     weather_message = {
         "city": message.city,
         "time": message.time
     }
-    weather_result = send_message_to_rabbit(
-        json.dumps(weather_message),
-        os.getenv('WEATHER_QUEUE')
-    )
-
     tourism_message = {
         "interests": message.interests
     }
-    tourism_result = send_message_to_rabbit(
-        json.dumps(tourism_message),
-        os.getenv('TOURISM_QUEUE')
-    )
+    # El job_id viaja como correlation_id: el worker une las dos mitades con
+    # él y lo usa en los eventos de ITINERARY_EXCHANGE
+    weather_result, tourism_result = await run_blocking(io_executor, send_messages_to_rabbit, [
+        (json.dumps(weather_message), os.getenv('WEATHER_QUEUE')),
+        (json.dumps(tourism_message), os.getenv('TOURISM_QUEUE'))
+    ], correlation_id=job.job_id)
 
-    return {
-        "weather_queue_result": weather_result,
-        "tourism_queue_result": tourism_result,
-        "status": "Messages sent successfully"
-    }
+    response["weather_queue_result"] = weather_result
+    response["tourism_queue_result"] = tourism_result
+    return response
+
+
+@app.get("/itineraries/{job_id}")
+async def get_itinerary_job(job_id: str, wait: float = 0, version: int = None):
+    """
+    Estado del job. Con `wait` la respuesta se retiene hasta que haya una
+    novedad respecto de `version` (por defecto, la actual) o pasen `wait`
+    segundos (máximo JOB_LONG_POLL_MAX).
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+
+    if wait > 0:
+        job = await job_store.wait(job_id, job.version if version is None else version,
+                                   min(wait, JOB_LONG_POLL_MAX))
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job no encontrado")
+    return job.snapshot()
+
+
+@app.get("/itineraries/{job_id}/events")
+async def itinerary_job_events(job_id: str):
+    """
+    Server-Sent Events: un evento `progress` por cada etapa terminada y un
+    evento final `done` (con el itinerario) o `failed`.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job no encontrado")
+
+    async def events():
+        current = job
+        while True:
+            snapshot = current.snapshot()
+            event = snapshot["status"] if snapshot["status"] in FINAL_STATUSES else "progress"
+            yield f"event: {event}\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            if event != "progress":
+                return
+
+            version = snapshot["version"]
+            while current is not None and current.version == version and current.status not in FINAL_STATUSES:
+                current = await job_store.wait(job_id, version, JOB_LONG_POLL_MAX)
+                if current is not None and current.version == version:
+                    # Comentario SSE para que los proxies no corten la conexión
+                    yield ": keep-alive\n\n"
+            if current is None:
+                return
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/cacheStats")
+async def get_cache_stats():
+    return {**cache_stats(), "gazetteer": gazetteer.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/persistenceStats")
+async def get_persistence_stats():
+    return persistence_stats()
+
+
+@app.get("/jobStats")
+async def get_job_stats():
+    return job_store.stats()
+
+
+@app.get("/singleFlightStats")
+async def get_single_flight_stats():
+    # leaders: cálculos hechos; shared: llamadas que esperaron uno en curso
+    return single_flight_stats()
 
 
 ##Endpooints de prueba
 
 @app.get("/viewMessages")
 async def get_messages():
-    result = read_messages_from_rabbit(20, "travel_messages")
+    result = await run_blocking(io_executor, read_messages_from_rabbit, 20, "travel_messages")
 
     return {
         "result": result
@@ -187,21 +356,14 @@ async def get_messages():
 
 @app.get("/viewWeatherMessages")
 async def get_messages_weather():
-    result = read_messages_from_rabbit(1, os.getenv('WEATHER_QUEUE'))
+    result = await run_blocking(io_executor, read_messages_from_rabbit, 1, os.getenv('WEATHER_QUEUE'))
 
     outs = []
     for message in result:
         city = message["city"]
         time = message["time"]
-        try:
-            days = int(time)
-        except ValueError:
-            match = re.search(r'\d+', time)
-            if match:
-                days = int(match.group())
-            else:
-                days = 5
-        agent_result = weather_agent.run_weather_forecast(city, days)
+        days = validate_time_string(time)
+        agent_result = await run_blocking(agent_executor, weather_agent.run_weather_forecast, city, days)
         outs.append(agent_result)
 
     return {
@@ -211,22 +373,16 @@ async def get_messages_weather():
 
 @app.get("/viewTourismMessages")
 async def get_messages_tourism():
-    result = read_messages_from_rabbit(1, os.getenv('TOURISM_QUEUE'))
+    result = await run_blocking(io_executor, read_messages_from_rabbit, 1, os.getenv('TOURISM_QUEUE'))
 
     outs = []
     for message in result:
-        interests = message["interests"]  # Ahora es un arreglo
-
-        # Validar que interests sea una lista
-        if not isinstance(interests, list):
-            # Si viene como string, convertirlo a lista
-            if isinstance(interests, str):
-                interests = [interests]
-            else:
-                interests = []
+        interests = normalize_interests(message["interests"])
 
         try:
-            agent_result = tourism_agent.run_tourism_category_selector(
+            agent_result = await run_blocking(
+                agent_executor,
+                tourism_agent.run_tourism_category_selector,
                 user_interests=interests,
                 latitude=5.5353,
                 longitude=-73.3678
@@ -247,102 +403,10 @@ async def get_messages_tourism():
     }
 
 
-def save_to_postgres(city: str, time_str: str, weather_data: str, tourism_data: str, itinerary_text: str) -> None:
-    """
-    Guarda los datos del itinerario en todas las tablas relacionadas.
-    """
-    try:
-        with get_postgres_connection() as conn:
-            cursor = conn.cursor()
-
-            # 1. Usar el user_id existente (puedes cambiarlo por el real del usuario actual)
-            user_id = '00000000-0000-0000-0000-000000000001'
-
-            # 2. Calcular fechas de inicio y fin basadas en time_str
-            from datetime import datetime, timedelta
-            start_date = datetime.now().date()
-
-            # Extraer los días del time_str (asume formato como "3 days", "1 week", etc.)
-            days = validate_time_string(time_str)
-            end_date = start_date + timedelta(days=days)
-
-            # 3. Insertar en la tabla itineraries y obtener el ID generado
-            print("Insertando itinerario...")
-            cursor.execute("""
-                           INSERT INTO itineraries (user_id, destination, start_date, end_date, weather_summary,
-                                                    itinerary_details)
-                           VALUES (%s, %s, %s, %s, %s, %s) RETURNING id;
-                           """, (user_id, city, start_date, end_date, str(weather_data)[:500], itinerary_text))
-
-            itinerary_id = cursor.fetchone()[0]
-            print(f"Itinerario insertado con ID: {itinerary_id}")
-
-            # 4. Insertar en la tabla weather
-            print("Insertando datos del clima...")
-            try:
-                # Intenta parsear weather_data si es JSON
-                import json
-                if isinstance(weather_data, str):
-                    weather_json = json.loads(weather_data) if weather_data.startswith('{') else {
-                        "forecast": weather_data}
-                else:
-                    weather_json = weather_data
-
-                temperature = weather_json.get('temperature', None)
-                description = weather_json.get('description', str(weather_data)[:255])
-                forecast = json.dumps(weather_json) if isinstance(weather_json, dict) else str(weather_data)
-
-            except:
-                temperature = None
-                description = str(weather_data)[:255]
-                forecast = json.dumps({"raw": str(weather_data)})
-
-            cursor.execute("""
-                           INSERT INTO weather (itinerary_id, temperature, description, forecast)
-                           VALUES (%s, %s, %s, %s::jsonb);
-                           """, (itinerary_id, temperature, description, forecast))
-
-            print("Datos del clima insertados")
-
-            # 5. Insertar en la tabla destinations
-            print("Insertando destino...")
-            try:
-                # Intenta parsear tourism_data si es JSON o tiene actividades
-                if isinstance(tourism_data, str):
-                    tourism_json = json.loads(tourism_data) if tourism_data.startswith('{') or tourism_data.startswith(
-                        '[') else {"activities": tourism_data}
-                else:
-                    tourism_json = tourism_data
-
-                activities = tourism_json if isinstance(tourism_json, (dict, list)) else {
-                    "activities": str(tourism_data)}
-
-            except:
-                activities = {"activities": str(tourism_data)}
-
-            cursor.execute("""
-                           INSERT INTO destinations (itinerary_id, city, activities, estimated_weather, order_index)
-                           VALUES (%s, %s, %s::jsonb, %s, %s);
-                           """, (itinerary_id, city, json.dumps(activities), description, 1))
-
-            print("Destino insertado")
-
-            # 6. Commit de todas las transacciones
-            conn.commit()
-            cursor.close()
-
-            print(f"✅ Todos los datos guardados exitosamente. Itinerary ID: {itinerary_id}")
-
-    except Exception as e:
-        print(f"❌ Error guardando en PostgreSQL: {e}")
-        import traceback
-        traceback.print_exc()
-
-
 @app.post("/sendMessage")
 async def send_message(message: MessageRequest):
     full_message_json = message.model_dump_json()
-    result = send_message_to_rabbit(full_message_json, "travel_messages")
+    result = await run_blocking(io_executor, send_message_to_rabbit, full_message_json, "travel_messages")
 
     return {
         "result": result
@@ -352,7 +416,7 @@ async def send_message(message: MessageRequest):
 @app.post("/sendWeatherInfo")
 async def send_message(message: MessageRequestForWeather):
     full_message_json = message.model_dump_json()
-    result = send_message_to_rabbit(full_message_json, os.getenv('WEATHER_QUEUE'))
+    result = await run_blocking(io_executor, send_message_to_rabbit, full_message_json, os.getenv('WEATHER_QUEUE'))
 
     return {
         "result": result
@@ -362,7 +426,7 @@ async def send_message(message: MessageRequestForWeather):
 @app.post("/sendTourismInfo")
 async def send_message(message: MessageRequestForTourism):
     full_message_json = message.model_dump_json()
-    result = send_message_to_rabbit(full_message_json, os.getenv('TOURISM_QUEUE'))
+    result = await run_blocking(io_executor, send_message_to_rabbit, full_message_json, os.getenv('TOURISM_QUEUE'))
 
     return {
         "result": result
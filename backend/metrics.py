@@ -0,0 +1,161 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Etapas del itinerario: de milisegundos (cache, Postgres) a minutos (crews)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200)
+
+
+class Histogram:
+    """
+    Histograma acumulado al estilo Prometheus, con etiquetas.
+    """
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float], label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            # [conteo por bucket..., +Inf, suma]
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            base = [f'{name}="{value}"' for name, value in zip(self.label_names, labels)]
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                label_text = ','.join(base + [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{{{label_text}}} {count}")
+            suffix = '{' + ','.join(base) + '}' if base else ''
+            lines.append(f"{self.name}_sum{suffix} {values[-1]}")
+            lines.append(f"{self.name}_count{suffix} {values[-2]}")
+        return lines
+
+
+_registry: List[Histogram] = []
+
+stage_seconds = Histogram("smartroute_stage_seconds", "Duración de cada etapa del itinerario",
+                          STAGE_BUCKETS, ["stage"])
+http_request_seconds = Histogram("smartroute_http_request_seconds", "Duración de las peticiones a la API",
+                                 STAGE_BUCKETS, ["path"])
+ollama_prompt_tokens = Histogram("smartroute_ollama_prompt_tokens", "Tokens del prompt por generación",
+                                 TOKEN_BUCKETS)
+ollama_output_tokens = Histogram("smartroute_ollama_output_tokens", "Tokens generados por generación",
+                                 TOKEN_BUCKETS)
+ollama_tokens_per_second = Histogram("smartroute_ollama_tokens_per_second", "Velocidad de generación de Ollama",
+                                     RATE_BUCKETS)
+
+# Desglose de la petición en curso: lista de (etapa, segundos). La lista se
+# comparte con los hilos que heredan el contexto (ver executors.run_blocking)
+_breakdown: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "stage_breakdown", default=None
+)
+# Función (etapa, segundos) que se llama al terminar cada etapa; también se
+# hereda en los hilos. La usan los jobs para reportar su progreso
+_stage_listener: contextvars.ContextVar[Optional[Callable[[str, float], None]]] = contextvars.ContextVar(
+    "stage_listener", default=None
+)
+
+
+def record(stage: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, stage)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown.append((stage, seconds))
+    listener = _stage_listener.get()
+    if listener is not None:
+        listener(stage, seconds)
+
+
+def on_stage(listener: Optional[Callable[[str, float], None]]) -> None:
+    _stage_listener.set(listener)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Mide el bloque y lo registra en el histograma y en el desglose de la
+    petición actual.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def start_breakdown() -> List[Tuple[str, float]]:
+    breakdown = []
+    _breakdown.set(breakdown)
+    return breakdown
+
+
+def server_timing(breakdown: List[Tuple[str, float]]) -> str:
+    """
+    Desglose en formato Server-Timing (una entrada por etapa, en ms).
+    """
+    totals = defaultdict(float)
+    for stage, seconds in breakdown:
+        totals[stage] += seconds
+    return ', '.join(f"{stage.replace(' ', '_')};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+def record_generation(response, seconds: float) -> None:
+    """
+    Tokens del prompt, tokens generados y tokens/s de una respuesta de
+    ChatOllama (usage_metadata de LangChain).
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens")
+    output_tokens = usage.get("output_tokens")
+    if prompt_tokens:
+        ollama_prompt_tokens.observe(prompt_tokens)
+    if output_tokens:
+        ollama_output_tokens.observe(output_tokens)
+        if seconds > 0:
+            ollama_tokens_per_second.observe(output_tokens / seconds)
+
+
+class TaskTimer:
+    """
+    task_callback para un Crew: registra cuánto tardó cada Task como la
+    etapa `prefix.nombre`.
+    """
+
+    def __init__(self, prefix: str, task_names: Sequence[str]):
+        self.prefix = prefix
+        self.task_names = list(task_names)
+        self._index = 0
+        self._last = time.perf_counter()
+
+    def __call__(self, output) -> None:
+        now = time.perf_counter()
+        name = self.task_names[self._index] if self._index < len(self.task_names) else str(self._index)
+        record(f"{self.prefix}.{name}", now - self._last)
+        self._index += 1
+        self._last = now
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in _registry:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
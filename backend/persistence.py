@@ -0,0 +1,272 @@
+import json
+import os
+import queue
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from psycopg2.extras import execute_batch
+
+from connections import get_postgres_connection
+from itinerary_params import validate_time_string
+from metrics import span
+
+# write_behind: la API encola el itinerario y responde sin esperar a Postgres
+# (WriteBehindWriter guarda varios por transacción); direct: se guarda antes
+# de responder
+PERSISTENCE_MODE = os.getenv('PERSISTENCE_MODE', 'write_behind')
+PERSISTENCE_QUEUE_SIZE = int(os.getenv('PERSISTENCE_QUEUE_SIZE', '1000'))
+PERSISTENCE_BATCH_SIZE = int(os.getenv('PERSISTENCE_BATCH_SIZE', '50'))
+PERSISTENCE_FLUSH_SECONDS = float(os.getenv('PERSISTENCE_FLUSH_SECONDS', '1'))
+PERSISTENCE_MAX_RETRIES = int(os.getenv('PERSISTENCE_MAX_RETRIES', '5'))
+
+# Usar el user_id existente (puedes cambiarlo por el real del usuario actual)
+DEFAULT_USER_ID = '00000000-0000-0000-0000-000000000001'
+
+# Las tres tablas en una sola sentencia (un viaje a la base): los CTE
+# comparten el id generado para el itinerario
+INSERT_ITINERARY_SQL = """
+                       WITH new_itinerary AS (
+                           INSERT INTO itineraries (user_id, destination, start_date, end_date, weather_summary,
+                                                    itinerary_details)
+                           VALUES (%(user_id)s, %(city)s, %(start_date)s, %(end_date)s, %(weather_summary)s,
+                                   %(itinerary_text)s)
+                           RETURNING id
+                       ), new_weather AS (
+                           INSERT INTO weather (itinerary_id, temperature, description, forecast)
+                           SELECT id, %(temperature)s, %(description)s, %(forecast)s::jsonb
+                           FROM new_itinerary
+                       )
+                       INSERT INTO destinations (itinerary_id, city, activities, estimated_weather, order_index)
+                       SELECT id, %(city)s, %(activities)s::jsonb, %(description)s, 1
+                       FROM new_itinerary
+                       RETURNING itinerary_id;
+                       """
+
+
+def build_itinerary_row(city: str, time_str: str, weather_data, tourism_data, itinerary_text: str) -> Dict[str, Any]:
+    """
+    Prepara los parámetros de INSERT_ITINERARY_SQL a partir de las salidas de
+    los agentes.
+    """
+    # Calcular fechas de inicio y fin basadas en time_str
+    start_date = datetime.now().date()
+    end_date = start_date + timedelta(days=validate_time_string(time_str))
+
+    try:
+        # Intenta parsear weather_data si es JSON
+        if isinstance(weather_data, str):
+            weather_json = json.loads(weather_data) if weather_data.startswith('{') else {"forecast": weather_data}
+        else:
+            weather_json = weather_data
+
+        temperature = weather_json.get('temperature', None)
+        description = weather_json.get('description', str(weather_data)[:255])
+        forecast = json.dumps(weather_json) if isinstance(weather_json, dict) else str(weather_data)
+    except Exception:
+        temperature = None
+        description = str(weather_data)[:255]
+        forecast = json.dumps({"raw": str(weather_data)})
+
+    try:
+        # Intenta parsear tourism_data si es JSON o tiene actividades
+        if isinstance(tourism_data, str):
+            tourism_json = json.loads(tourism_data) if tourism_data.startswith('{') or tourism_data.startswith(
+                '[') else {"activities": tourism_data}
+        else:
+            tourism_json = tourism_data
+
+        activities = tourism_json if isinstance(tourism_json, (dict, list)) else {"activities": str(tourism_data)}
+    except Exception:
+        activities = {"activities": str(tourism_data)}
+
+    return {
+        "user_id": DEFAULT_USER_ID,
+        "city": city,
+        "start_date": start_date,
+        "end_date": end_date,
+        "weather_summary": str(weather_data)[:500],
+        "itinerary_text": itinerary_text,
+        "temperature": temperature,
+        "description": description,
+        "forecast": forecast,
+        "activities": json.dumps(activities)
+    }
+
+
+def save_itinerary_rows(rows: List[Dict[str, Any]]) -> None:
+    """
+    Guarda varios itinerarios en una sola transacción; execute_batch manda
+    las sentencias en bloques de 100 por viaje.
+    """
+    with span("postgres.save_batch"), get_postgres_connection() as conn:
+        cursor = conn.cursor()
+        execute_batch(cursor, INSERT_ITINERARY_SQL, rows, page_size=100)
+        conn.commit()
+        cursor.close()
+
+
+def save_to_postgres(city: str, time_str: str, weather_data: str, tourism_data: str, itinerary_text: str) -> None:
+    """
+    Guarda los datos del itinerario en todas las tablas relacionadas.
+    """
+    try:
+        row = build_itinerary_row(city, time_str, weather_data, tourism_data, itinerary_text)
+        with span("postgres.save"), get_postgres_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(INSERT_ITINERARY_SQL, row)
+            itinerary_id = cursor.fetchone()[0]
+            conn.commit()
+            cursor.close()
+
+        print(f"✅ Todos los datos guardados exitosamente. Itinerary ID: {itinerary_id}")
+
+    except Exception as e:
+        print(f"❌ Error guardando en PostgreSQL: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+class WriteBehindWriter:
+    """
+    Persistencia en segundo plano: los itinerarios entran a una cola acotada
+    y un hilo propio los guarda en lotes de hasta `batch_size` por
+    transacción, reintentando con backoff si Postgres falla. Si el lote
+    sigue fallando se parte en mitades para no perder las filas buenas por
+    una mala.
+
+    Cuando la cola está llena add() devuelve False para que quien llama lo
+    guarde directamente (backpressure en vez de crecer sin límite).
+    """
+
+    def __init__(self, max_queue: int = PERSISTENCE_QUEUE_SIZE, batch_size: int = PERSISTENCE_BATCH_SIZE,
+                 flush_seconds: float = PERSISTENCE_FLUSH_SECONDS, max_retries: int = PERSISTENCE_MAX_RETRIES):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.enqueued = 0
+        self.written = 0
+        self.rejected = 0
+        self.retries = 0
+        self.failed = 0
+        self.max_depth = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="itinerary-writer", daemon=True)
+        self._thread.start()
+
+    def add(self, row: Dict[str, Any]) -> bool:
+        if self._closed.is_set():
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        try:
+            rows = [self._queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        while len(rows) < self.batch_size:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._save(rows)
+                return
+            except Exception as e:
+                print(f"❌ Error guardando {len(rows)} itinerarios en PostgreSQL (intento {attempt + 1}): {e}")
+                if attempt == self.max_retries:
+                    break
+                with self._lock:
+                    self.retries += 1
+                # Al cerrar se reintenta sin esperar tanto
+                self._closed.wait(min(0.5 * 2 ** attempt, 30))
+        self._bisect(rows)
+
+    def _save(self, rows: List[Dict[str, Any]]) -> None:
+        save_itinerary_rows(rows)
+        with self._lock:
+            self.written += len(rows)
+        print(f"✅ {len(rows)} itinerarios guardados")
+
+    def _bisect(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Guarda cada mitad del lote por separado hasta aislar las filas que
+        fallan; solo esas cuentan en `failed`.
+        """
+        if len(rows) == 1:
+            with self._lock:
+                self.failed += 1
+            print(f"❌ Itinerario descartado: {rows[0].get('city')}")
+            return
+        middle = len(rows) // 2
+        for half in (rows[:middle], rows[middle:]):
+            try:
+                self._save(half)
+            except Exception as e:
+                print(f"❌ Error guardando {len(half)} itinerarios en PostgreSQL: {e}")
+                self._bisect(half)
+
+    def _loop(self) -> None:
+        while not (self._closed.is_set() and self._queue.empty()):
+            rows = self._next_batch()
+            if rows:
+                self._write(rows)
+
+    def close(self, timeout: float = 30.0) -> None:
+        """
+        Deja de aceptar itinerarios y espera a que se guarden los pendientes.
+        """
+        self._closed.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"⚠️  {self._queue.qsize()} itinerarios sin guardar al cerrar")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "failed": self.failed
+        }
+
+
+itinerary_writer = WriteBehindWriter() if PERSISTENCE_MODE == 'write_behind' else None
+
+
+def enqueue_itinerary(city: str, time_str: str, weather_data, tourism_data, itinerary_text: str) -> bool:
+    """
+    Encola el itinerario para guardarlo en segundo plano. Devuelve False si
+    hay que guardarlo directamente (modo direct o cola llena).
+    """
+    if itinerary_writer is None:
+        return False
+    return itinerary_writer.add(build_itinerary_row(city, time_str, weather_data, tourism_data, itinerary_text))
+
+
+def persistence_stats() -> Dict[str, Any]:
+    if itinerary_writer is None:
+        return {"mode": PERSISTENCE_MODE}
+    return {"mode": PERSISTENCE_MODE, **itinerary_writer.stats()}
+
+
+def close_persistence() -> None:
+    if itinerary_writer is not None:
+        itinerary_writer.close()
@@ -0,0 +1,199 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cache import normalize_text
+from executors import agent_executor, http_executor, run_blocking, stage_executor, submit
+from gazetteer import gazetteer
+from itinerary_params import validate_time_string
+from tourism_agent import tourism_agent
+from weather_agent import weather_agent
+from weather_agent.weather_api import fetch_coordinates
+from langchain import extract_text, generar_itinerario, generar_itinerario_async, generar_itinerario_stream
+from metrics import span
+from prompt_compactor import build_compact_prompt
+from singleflight import SingleFlight
+
+# Peticiones simultáneas que comparten etapas se calculan una sola vez: el
+# clima depende solo de ciudad y días, las categorías solo de los intereses
+# y la búsqueda de lugares de categorías y coordenadas
+weather_flights = SingleFlight("weather")
+category_flights = SingleFlight("tourism.categories")
+search_flights = SingleFlight("tourism.search")
+places_flights = SingleFlight("tourism.places")
+# Itinerarios completos, por itinerary_cache.request_key
+itinerary_flights = SingleFlight("itinerary")
+
+
+def normalize_interests(interests) -> List[str]:
+    if not isinstance(interests, list):
+        if isinstance(interests, str):
+            return [interests]
+        return []
+    return interests
+
+
+def _select_categories(interests: List[str]) -> List[str]:
+    key = tuple(sorted({normalize_text(i) for i in interests}))
+    with span("tourism.categories"):
+        return category_flights.do(key, lambda: tourism_agent.run_category_selection(interests))
+
+
+def _search_places(city: str, interests: List[str]):
+    """
+    Rama de turismo que no necesita el clima: categorías, coordenadas (del
+    gazetteer, sin esperar al agente del clima) y búsqueda de lugares.
+
+    Returns:
+        Tupla (categorías, lat, lon, lugares encontrados)
+    """
+    selected_categories = _select_categories(interests)
+    print(f"Categorías seleccionadas: {selected_categories}")
+
+    with span("tourism.coordinates"):
+        coordinates = gazetteer.lookup(city)
+        suggestion = gazetteer.suggest(city) if coordinates is None else None
+
+    places = None
+    if suggestion is not None:
+        # Solo un nombre parecido: se busca ya alrededor de él mientras
+        # /weather confirma que es el mismo lugar; si no lo es, se repite la
+        # búsqueda en las coordenadas de /weather
+        confirmation = submit(http_executor, fetch_coordinates, city)
+        places = _search_around(selected_categories, suggestion.latitude, suggestion.longitude)
+        with span("tourism.coordinates_confirm"):
+            coordinates = confirmation.result()
+        if gazetteer.confirm(city, suggestion, *coordinates):
+            coordinates = suggestion.latitude, suggestion.longitude
+        else:
+            places = None
+    elif coordinates is None:
+        with span("tourism.coordinates"):
+            coordinates = fetch_coordinates(city)
+
+    lat, lon = coordinates
+    print(f"Coordenadas de {city}: lat={lat}, lon={lon}")
+    if places is None:
+        places = _search_around(selected_categories, lat, lon)
+    return selected_categories, lat, lon, places
+
+
+def _search_around(categories: List[str], lat: Optional[float], lon: Optional[float]):
+    key = (tuple(sorted(categories)), lat, lon)
+    with span("tourism.search"):
+        return search_flights.do(key, lambda: tourism_agent.run_places_search(categories, lat, lon))
+
+
+def run_agents(city: str, days: int, interests: List[str]) -> Tuple[Any, Any]:
+    """
+    Ejecuta los agentes del clima y de turismo para un itinerario.
+
+    Returns:
+        Tupla (resultado del clima, resultado de turismo)
+    """
+    # La búsqueda de lugares solo necesita intereses y coordenadas: arranca ya
+    # y corre mientras el agente del clima consulta el pronóstico
+    search_future = submit(stage_executor, _search_places, city, normalize_interests(interests))
+
+    with span("weather"):
+        weather_result = weather_flights.do(
+            (normalize_text(city), days), lambda: weather_agent.run_weather_forecast(city, days)
+        )
+
+    print("Resultado del agente del clima:\n\n")
+    print(weather_result)
+
+    with span("tourism.search_wait"):
+        selected_categories, lat, lon, places = search_future.result()
+
+    # La selección final usa el clima, por eso la llave incluye ciudad y días
+    places_key = (tuple(sorted(selected_categories)), lat, lon, normalize_text(city), days)
+    with span("tourism.places"):
+        tourism_result = places_flights.do(
+            places_key, lambda: tourism_agent.run_final_selection(places, [weather_result])
+        )
+
+    return weather_result, tourism_result
+
+
+def build_prompt_payload(weather_result, tourism_result) -> str:
+    final_result = [weather_result, tourism_result]
+
+    print("Resultado final de los agentes:\n\n")
+    print(final_result)
+
+    return build_compact_prompt(weather_result, tourism_result)
+
+
+def run_itinerary_pipeline(city: str, time: str, interests: List[str],
+                           generate: Optional[Callable[[str], str]] = None) -> Dict[str, Any]:
+    """
+    Ejecuta el flujo completo para un itinerario: agente del clima, agente de
+    turismo y generación del texto final con Ollama.
+
+    Args:
+        generate: función prompt -> texto para la última etapa; por defecto
+            generar_itinerario (el worker pasa su MicroBatcher)
+
+    Returns:
+        Diccionario con el texto del itinerario y las salidas de cada agente
+    """
+    weather_result, tourism_result = run_agents(city, validate_time_string(time), interests)
+
+    prompt = build_prompt_payload(weather_result, tourism_result)
+    with span("ollama.generate"):
+        out = generate(prompt) if generate is not None else extract_text(generar_itinerario(prompt))
+
+    print("Aca va la salida")
+    print(out)
+
+    return {
+        "itinerary": out,
+        "weather": weather_result,
+        "tourism": tourism_result
+    }
+
+
+async def run_itinerary_pipeline_async(city: str, time: str, interests: List[str]) -> Dict[str, Any]:
+    """
+    Versión para el event loop de run_itinerary_pipeline: los crews corren en
+    agent_executor y la generación usa el cliente asíncrono de Ollama.
+    """
+    weather_result, tourism_result = await run_blocking(
+        agent_executor, run_agents, city, validate_time_string(time), interests
+    )
+
+    prompt = build_prompt_payload(weather_result, tourism_result)
+    with span("ollama.generate"):
+        out = extract_text(await generar_itinerario_async(prompt))
+
+    print("Aca va la salida")
+    print(out)
+
+    return {
+        "itinerary": out,
+        "weather": weather_result,
+        "tourism": tourism_result
+    }
+
+
+async def stream_itinerary_pipeline(city: str, time: str, interests: List[str], on_complete=None):
+    """
+    Igual que run_itinerary_pipeline_async pero entrega el texto del
+    itinerario por fragmentos mientras Ollama lo genera. Al terminar llama a
+    `on_complete(resultado)` con el mismo diccionario que las otras versiones.
+    """
+    weather_result, tourism_result = await run_blocking(
+        agent_executor, run_agents, city, validate_time_string(time), interests
+    )
+
+    parts = []
+    with span("ollama.generate"):
+        async for token in generar_itinerario_stream(build_prompt_payload(weather_result, tourism_result)):
+            parts.append(token)
+            yield token
+
+    if on_complete is not None:
+        await on_complete({
+            "itinerary": "".join(parts),
+            "weather": weather_result,
+            "tourism": tourism_result
+        })
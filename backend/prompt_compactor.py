@@ -0,0 +1,135 @@
+import importlib.util
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from cache import normalize_text
+
+PROMPT_MAX_PLACES = int(os.getenv('PROMPT_MAX_PLACES', '8'))
+# exact: cuenta tokens con el tokenizer de transformer.py (solo el tokenizer,
+# no los pesos); approx: estimación de ~4 caracteres por token, la única
+# opción si transformers no está instalado
+PROMPT_TOKEN_COUNT = os.getenv('PROMPT_TOKEN_COUNT', 'exact')
+if PROMPT_TOKEN_COUNT == 'exact' and importlib.util.find_spec('transformers') is None:
+    PROMPT_TOKEN_COUNT = 'approx'
+
+# Tipos que Google Places agrega a casi todo y no describen el lugar
+GENERIC_TYPES = {"point_of_interest", "establishment", "tourist_attraction"}
+
+
+def count_tokens(text: str) -> int:
+    if PROMPT_TOKEN_COUNT == 'exact':
+        from transformer import get_tokenizer
+        return len(get_tokenizer().encode(text, truncation=False))
+    return len(text) // 4
+
+
+def _round(value: Any, digits: int = 1) -> Any:
+    try:
+        return round(float(value), digits)
+    except (TypeError, ValueError):
+        return None
+
+
+def _primary_type(types: List[str]) -> Optional[str]:
+    for place_type in types or []:
+        if place_type not in GENERIC_TYPES:
+            return place_type
+    return types[0] if types else None
+
+
+def compact_weather(weather_result) -> Dict[str, Any]:
+    """
+    Ciudad, clima actual y una fila por día. Las coordenadas y los campos que
+    el prompt no usa se descartan.
+    """
+    if not isinstance(weather_result, dict):
+        return {"city": None, "current": None, "days": [], "notes": str(weather_result)}
+
+    current = weather_result.get("current") or {}
+    current_weather = current.get("weather") or {}
+    forecast = weather_result.get("forecast") or {}
+
+    days = []
+    for day in forecast.get("forecasts", []):
+        temperature = day.get("temperature") or {}
+        days.append({
+            "date": day.get("date"),
+            "description": day.get("description"),
+            "min": _round(temperature.get("min_temp")),
+            "max": _round(temperature.get("max_temp")),
+            "rain": _round(day.get("rain", 0)),
+            "wind": _round(day.get("wind_speed")),
+            "summary": day.get("summary")
+        })
+
+    return {
+        "city": forecast.get("city") or current.get("name"),
+        "current": {
+            "temperature": _round(current_weather.get("temperature")),
+            "description": current_weather.get("description")
+        } if current_weather else None,
+        "days": days
+    }
+
+
+def compact_places(tourism_result, max_places: int = PROMPT_MAX_PLACES) -> Dict[str, Any]:
+    """
+    Los `max_places` lugares mejor calificados con nombre, calificación y tipo
+    principal, sin repetidos.
+    """
+    if not isinstance(tourism_result, dict):
+        return {"places": [], "notes": str(tourism_result)}
+
+    places = []
+    seen = set()
+    for place in tourism_result.get("places", []):
+        name = place.get("name") or (place.get("displayName") or {}).get("text")
+        key = normalize_text(name or "")
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        places.append({
+            "name": name,
+            "rating": _round(place.get("rating")),
+            "type": _primary_type(place.get("types", []))
+        })
+
+    places.sort(key=lambda p: p["rating"] if p["rating"] is not None else -1, reverse=True)
+    return {"places": places[:max_places], "notes": tourism_result.get("weather_note")}
+
+
+def compact_payload(weather_result, tourism_result) -> Dict[str, Any]:
+    """
+    Proyección estable (siempre las mismas llaves) de las salidas de los
+    agentes para el prompt de generar_itinerario.
+    """
+    weather = compact_weather(weather_result)
+    tourism = compact_places(tourism_result)
+
+    # Si varios días comparten la misma recomendación solo se deja la primera
+    seen_summaries = set()
+    for day in weather["days"]:
+        if day["summary"] in seen_summaries:
+            day["summary"] = None
+        else:
+            seen_summaries.add(day["summary"])
+
+    notes = [n for n in (weather.get("notes"), tourism.get("notes")) if n]
+    return {
+        "city": weather["city"],
+        "current": weather["current"],
+        "days": weather["days"],
+        "places": tourism["places"],
+        "notes": list(dict.fromkeys(notes))
+    }
+
+
+def build_compact_prompt(weather_result, tourism_result) -> str:
+    compact = json.dumps(compact_payload(weather_result, tourism_result), ensure_ascii=False, separators=(',', ':'))
+
+    full = json.dumps([weather_result, tourism_result], ensure_ascii=False)
+    before, after = count_tokens(full), count_tokens(compact)
+    print(f"Prompt compactado: {before} -> {after} tokens ({PROMPT_TOKEN_COUNT})")
+
+    return compact
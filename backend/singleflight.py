@@ -0,0 +1,74 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Registro de cálculos en curso por llave: si llega una llamada con la
+    misma llave mientras otra la está calculando, espera ese resultado (o esa
+    excepción) en vez de repetir el trabajo. No guarda nada al terminar; para
+    eso están las caches.
+
+    `do` es para hilos y `do_async` para corutinas del event loop; cada una
+    tiene su propio registro. El resultado es el mismo objeto para todos los
+    que esperaban, así que no se debe modificar.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.leaders = 0
+        self.shared = 0
+        self._calls: Dict[Hashable, Future] = {}
+        self._tasks: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        _registry[name] = self
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._tasks.get(key)
+        if task is not None:
+            with self._lock:
+                self.shared += 1
+            # shield: si se cancela quien espera, el cálculo sigue para los demás
+            return await asyncio.shield(task)
+
+        with self._lock:
+            self.leaders += 1
+        task = self._tasks[key] = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            in_flight = len(self._calls) + len(self._tasks)
+        return {"leaders": self.leaders, "shared": self.shared, "in_flight": in_flight}
+
+
+_registry: Dict[str, SingleFlight] = {}
+
+
+def single_flight_stats() -> Dict[str, Dict[str, int]]:
+    return {name: flight.stats() for name, flight in _registry.items()}
@@ -0,0 +1,328 @@
+import difflib
+import os
+import re
+from typing import Dict, List, NamedTuple
+
+from cache import normalize_text
+
+CATEGORIES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'categories.txt')
+
+# Palabras clave en español e inglés -> tipos de Google Places de categories.txt.
+# Las llaves ya están normalizadas (sin tildes, minúscula).
+SYNONYMS: Dict[str, List[str]] = {
+    # Cultura
+    "historia": ["museum", "cultural_center", "tourist_attraction"],
+    "history": ["museum", "cultural_center", "tourist_attraction"],
+    "historico": ["museum", "tourist_attraction"],
+    "historic": ["museum", "tourist_attraction"],
+    "cultura": ["cultural_center", "museum", "art_gallery"],
+    "culture": ["cultural_center", "museum", "art_gallery"],
+    "museo": ["museum"],
+    "arte": ["art_gallery", "museum"],
+    "art": ["art_gallery", "museum"],
+    "galeria": ["art_gallery"],
+    "gallery": ["art_gallery"],
+    "teatro": ["performing_arts_theater"],
+    "theater": ["performing_arts_theater"],
+    "theatre": ["performing_arts_theater"],
+    "musica": ["performing_arts_theater", "cultural_center", "night_club"],
+    "music": ["performing_arts_theater", "cultural_center", "night_club"],
+    "concierto": ["performing_arts_theater"],
+    "concert": ["performing_arts_theater"],
+    "cine": ["movie_theater"],
+    "cinema": ["movie_theater"],
+    "movie": ["movie_theater"],
+    "pelicula": ["movie_theater"],
+    "arquitectura": ["tourist_attraction", "church", "city_hall"],
+    "architecture": ["tourist_attraction", "church", "city_hall"],
+    "biblioteca": ["library"],
+    "library": ["library"],
+    "libro": ["book_store", "library"],
+    "book": ["book_store", "library"],
+    "universidad": ["university"],
+    "university": ["university"],
+    "religion": ["church"],
+    "iglesia": ["church"],
+    "church": ["church"],
+    "catedral": ["church"],
+    "cathedral": ["church"],
+    "templo": ["church", "hindu_temple"],
+    "temple": ["church", "hindu_temple"],
+    "mezquita": ["mosque"],
+    "sinagoga": ["synagogue"],
+    # Turismo general
+    "turismo": ["tourist_attraction", "visitor_center"],
+    "tourism": ["tourist_attraction", "visitor_center"],
+    "turistico": ["tourist_attraction"],
+    "tourist": ["tourist_attraction"],
+    "sightseeing": ["tourist_attraction"],
+    "monumento": ["tourist_attraction"],
+    "monument": ["tourist_attraction"],
+    "mirador": ["tourist_attraction"],
+    "fotografia": ["tourist_attraction", "park", "art_gallery"],
+    "photography": ["tourist_attraction", "park", "art_gallery"],
+    # Naturaleza y aire libre
+    "naturaleza": ["park", "national_park"],
+    "nature": ["park", "national_park"],
+    "aire libre": ["park", "national_park"],
+    "outdoor": ["park", "national_park"],
+    "parque": ["park"],
+    "park": ["park"],
+    "senderismo": ["national_park", "park"],
+    "hiking": ["national_park", "park"],
+    "caminata": ["national_park", "park"],
+    "trekking": ["national_park"],
+    "montana": ["national_park"],
+    "mountain": ["national_park"],
+    "ecoturismo": ["national_park", "park"],
+    "camping": ["campground"],
+    "acampar": ["campground"],
+    "playa": ["marina", "tourist_attraction"],
+    "beach": ["marina", "tourist_attraction"],
+    "lago": ["marina", "park"],
+    "lake": ["marina", "park"],
+    "animal": ["zoo", "aquarium"],
+    "zoologico": ["zoo"],
+    "zoo": ["zoo"],
+    "acuario": ["aquarium"],
+    "aquarium": ["aquarium"],
+    "perro": ["dog_park"],
+    "dog": ["dog_park"],
+    # Familia y diversión
+    "familia": ["amusement_park", "zoo", "aquarium", "park"],
+    "family": ["amusement_park", "zoo", "aquarium", "park"],
+    "nino": ["amusement_park", "zoo", "aquarium"],
+    "kid": ["amusement_park", "zoo", "aquarium"],
+    "children": ["amusement_park", "zoo", "aquarium"],
+    "diversion": ["amusement_park", "amusement_center"],
+    "fun": ["amusement_park", "amusement_center"],
+    "atraccion": ["amusement_park", "tourist_attraction"],
+    "amusement": ["amusement_park", "amusement_center"],
+    "juego": ["amusement_center", "bowling_alley"],
+    "bolo": ["bowling_alley"],
+    "bowling": ["bowling_alley"],
+    "casino": ["casino"],
+    "apuesta": ["casino"],
+    # Gastronomía
+    "gastronomia": ["restaurant"],
+    "gastronomy": ["restaurant"],
+    "comida": ["restaurant"],
+    "food": ["restaurant"],
+    "restaurante": ["restaurant"],
+    "restaurant": ["restaurant"],
+    "cenar": ["restaurant"],
+    "dinner": ["restaurant"],
+    "cafe": ["cafe", "coffee_shop"],
+    "coffee": ["coffee_shop", "cafe"],
+    "panaderia": ["bakery"],
+    "bakery": ["bakery"],
+    "postre": ["bakery", "ice_cream_shop"],
+    "dessert": ["bakery", "ice_cream_shop"],
+    "helado": ["ice_cream_shop"],
+    "ice cream": ["ice_cream_shop"],
+    "desayuno": ["breakfast_restaurant"],
+    "breakfast": ["breakfast_restaurant"],
+    "brunch": ["brunch_restaurant"],
+    "comida rapida": ["fast_food_restaurant"],
+    "fast food": ["fast_food_restaurant"],
+    "hamburguesa": ["hamburger_restaurant"],
+    "burger": ["hamburger_restaurant"],
+    "pizza": ["pizza_restaurant"],
+    "sushi": ["sushi_restaurant"],
+    "ramen": ["ramen_restaurant"],
+    "mariscos": ["seafood_restaurant"],
+    "seafood": ["seafood_restaurant"],
+    "carne": ["steak_house", "barbecue_restaurant"],
+    "steak": ["steak_house"],
+    "asado": ["barbecue_restaurant", "steak_house"],
+    "barbecue": ["barbecue_restaurant"],
+    "vegano": ["vegan_restaurant"],
+    "vegan": ["vegan_restaurant"],
+    "vegetariano": ["vegetarian_restaurant"],
+    "vegetarian": ["vegetarian_restaurant"],
+    "italiana": ["italian_restaurant"],
+    "italian": ["italian_restaurant"],
+    "mexicana": ["mexican_restaurant"],
+    "mexican": ["mexican_restaurant"],
+    "japonesa": ["japanese_restaurant", "sushi_restaurant"],
+    "japanese": ["japanese_restaurant", "sushi_restaurant"],
+    "china": ["chinese_restaurant"],
+    "chinese": ["chinese_restaurant"],
+    "francesa": ["french_restaurant"],
+    "french": ["french_restaurant"],
+    "espanola": ["spanish_restaurant"],
+    "spanish": ["spanish_restaurant"],
+    "griega": ["greek_restaurant"],
+    "greek": ["greek_restaurant"],
+    "india": ["indian_restaurant"],
+    "indian": ["indian_restaurant"],
+    "tailandesa": ["thai_restaurant"],
+    "thai": ["thai_restaurant"],
+    "turca": ["turkish_restaurant"],
+    "turkish": ["turkish_restaurant"],
+    "mediterranea": ["mediterranean_restaurant"],
+    "mediterranean": ["mediterranean_restaurant"],
+    "brasilena": ["brazilian_restaurant"],
+    "brazilian": ["brazilian_restaurant"],
+    "americana": ["american_restaurant"],
+    "american": ["american_restaurant"],
+    # Vida nocturna
+    "vida nocturna": ["night_club", "bar"],
+    "nightlife": ["night_club", "bar"],
+    "noche": ["night_club", "bar"],
+    "fiesta": ["night_club", "bar"],
+    "party": ["night_club", "bar"],
+    "rumba": ["night_club", "bar"],
+    "discoteca": ["night_club"],
+    "club": ["night_club"],
+    "bar": ["bar"],
+    "cerveza": ["bar"],
+    "beer": ["bar"],
+    "coctel": ["bar"],
+    "cocktail": ["bar"],
+    "vino": ["bar"],
+    "wine": ["bar"],
+    # Compras
+    "compras": ["shopping_mall", "market", "gift_shop"],
+    "shopping": ["shopping_mall", "market", "gift_shop"],
+    "tienda": ["store", "shopping_mall"],
+    "shop": ["store", "shopping_mall"],
+    "centro comercial": ["shopping_mall"],
+    "mall": ["shopping_mall"],
+    "mercado": ["market"],
+    "market": ["market"],
+    "artesania": ["gift_shop", "market"],
+    "souvenir": ["gift_shop"],
+    "craft": ["gift_shop", "market"],
+    "ropa": ["clothing_store"],
+    "clothing": ["clothing_store"],
+    "moda": ["clothing_store", "shoe_store"],
+    "fashion": ["clothing_store", "shoe_store"],
+    "joyeria": ["jewelry_store"],
+    "jewelry": ["jewelry_store"],
+    # Deporte y bienestar
+    "deporte": ["sports_complex", "stadium", "athletic_field"],
+    "sport": ["sports_complex", "stadium", "athletic_field"],
+    "futbol": ["stadium", "athletic_field"],
+    "football": ["stadium", "athletic_field"],
+    "soccer": ["stadium", "athletic_field"],
+    "estadio": ["stadium"],
+    "stadium": ["stadium"],
+    "gimnasio": ["gym", "fitness_center"],
+    "gym": ["gym", "fitness_center"],
+    "fitness": ["fitness_center", "gym"],
+    "golf": ["golf_course"],
+    "natacion": ["swimming_pool"],
+    "swimming": ["swimming_pool"],
+    "piscina": ["swimming_pool"],
+    "esqui": ["ski_resort"],
+    "ski": ["ski_resort"],
+    "spa": ["spa"],
+    "relajacion": ["spa"],
+    "relax": ["spa"],
+    "bienestar": ["spa"],
+    "wellness": ["spa"],
+    "termales": ["spa", "tourist_attraction"],
+    "hot springs": ["spa", "tourist_attraction"],
+}
+
+STOPWORDS = {
+    "de", "del", "la", "las", "el", "los", "y", "e", "o", "en", "con", "por", "para", "un", "una",
+    "the", "and", "or", "of", "in", "with", "for", "a", "an", "to", "me", "gusta", "gustan", "like",
+    "quiero", "visitar", "ver", "lugares", "places", "sitios",
+}
+
+MIN_CONFIDENCE = float(os.getenv('CATEGORY_MATCH_MIN_CONFIDENCE', '0.75'))
+FUZZY_CUTOFF = 0.8
+
+
+class CategoryMatch(NamedTuple):
+    categories: List[str]
+    confidence: float
+    unmatched: List[str]
+
+
+def _load_categories() -> List[str]:
+    with open(CATEGORIES_PATH, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip()]
+
+
+CATEGORIES = _load_categories()
+_CATEGORY_SET = set(CATEGORIES)
+
+# Índice único: sinónimos + nombres de categoría escritos con espacios
+# ("art gallery" -> art_gallery)
+_INDEX: Dict[str, List[str]] = {name.replace('_', ' '): [name] for name in CATEGORIES}
+for _keyword, _targets in SYNONYMS.items():
+    _INDEX[_keyword] = [t for t in _targets if t in _CATEGORY_SET]
+_INDEX_KEYS = list(_INDEX)
+
+
+def _singular_forms(token: str) -> List[str]:
+    forms = [token]
+    if token.endswith('es') and len(token) > 4:
+        forms.append(token[:-2])
+    if token.endswith('s') and len(token) > 3:
+        forms.append(token[:-1])
+    return forms
+
+
+def _match_token(token: str):
+    for form in _singular_forms(token):
+        if form in _INDEX:
+            return _INDEX[form], 1.0
+    best_key, best_ratio = None, 0.0
+    for form in _singular_forms(token):
+        for key in difflib.get_close_matches(form, _INDEX_KEYS, n=1, cutoff=FUZZY_CUTOFF):
+            ratio = difflib.SequenceMatcher(None, form, key).ratio()
+            if ratio > best_ratio:
+                best_key, best_ratio = key, ratio
+    if best_key is None:
+        return [], 0.0
+    return _INDEX[best_key], best_ratio
+
+
+def match_interest(interest: str):
+    """
+    Devuelve (categorías, confianza) para un interés del usuario. La
+    confianza es la de la palabra peor resuelta: en "deportes extremos" solo
+    "deportes" es conocida, y el interés no debe darse por resuelto.
+    """
+    text = normalize_text(interest)
+    if not text:
+        return [], 0.0
+
+    # Frase completa: "vida nocturna", "art_gallery", "comida rapida"
+    phrase = text.replace('_', ' ')
+    for form in _singular_forms(phrase):
+        if form in _INDEX:
+            return list(_INDEX[form]), 1.0
+
+    categories: List[str] = []
+    scores: List[float] = []
+    tokens = [t for t in re.split(r'[^a-z0-9]+', text) if len(t) > 2 and t not in STOPWORDS]
+    for token in tokens:
+        targets, score = _match_token(token)
+        scores.append(score)
+        categories.extend(t for t in targets if t not in categories)
+    return categories, min(scores, default=0.0)
+
+
+def match_interests(interests: List[str]) -> CategoryMatch:
+    """
+    Mapea los intereses del usuario a categorías de Google Places sin llamar
+    al LLM. La confianza global es la del interés peor resuelto, así que un
+    solo interés desconocido baja el resultado por debajo del umbral.
+    """
+    categories: List[str] = []
+    unmatched: List[str] = []
+    confidence = 1.0 if interests else 0.0
+
+    for interest in interests:
+        targets, score = match_interest(interest)
+        if not targets:
+            unmatched.append(interest)
+        confidence = min(confidence, score)
+        categories.extend(t for t in targets if t not in categories)
+
+    return CategoryMatch(categories=categories, confidence=confidence, unmatched=unmatched)
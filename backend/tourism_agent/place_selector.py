@@ -0,0 +1,211 @@
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from weather_agent.weather_summary import COLD_TEMP_C, HEAVY_RAIN_MM, HOT_TEMP_C, LIGHT_RAIN_MM, RAIN_WORDS
+
+from .category_matcher import CATEGORIES
+from .tourism_json import TourismAgentResponse
+
+MAX_FINAL_PLACES = 5
+# Máximo de lugares con el mismo tipo principal entre los elegidos
+MAX_PER_TYPE = 2
+# Peso de la calidad (puntaje de la búsqueda o calificación) frente al ajuste
+# con el clima
+QUALITY_WEIGHT = 0.6
+GENERIC_TYPES = {"point_of_interest", "establishment"}
+
+
+class Exposure(NamedTuple):
+    """
+    Cuánto afecta el clima a un tipo de lugar, de 0 (nada) a 1.
+    """
+    label: str
+    rain: float
+    heat: float
+    cold: float
+
+
+OUTDOOR = Exposure("al aire libre", rain=1.0, heat=0.7, cold=0.6)
+PARTIAL = Exposure("parcialmente cubierto", rain=0.5, heat=0.3, cold=0.3)
+INDOOR = Exposure("bajo techo", rain=0.0, heat=0.0, cold=0.0)
+
+# Tipos de categories.txt (y algunos que Places devuelve además) por exposición
+OUTDOOR_TYPES = {
+    "amusement_park", "athletic_field", "botanical_garden", "campground", "cemetery", "dog_park", "farm",
+    "farmstay", "ferry_terminal", "golf_course", "hiking_area", "marina", "national_park", "park", "plaza",
+    "rest_stop", "rv_park", "ski_resort", "stadium", "zoo", "beach"
+}
+PARTIAL_TYPES = {
+    "historical_landmark", "tourist_attraction", "visitor_center", "market", "sports_complex", "swimming_pool",
+    "amusement_center", "wedding_venue", "camping_cabin", "cottage", "resort_hotel"
+}
+INDOOR_SUFFIXES = ("_restaurant", "_store", "_shop", "_center", "_club", "_theater", "_salon")
+# Todo lo demás de categories.txt (museos, iglesias, restaurantes, tiendas...)
+# se considera bajo techo
+INDOOR_TYPES = set(CATEGORIES) - OUTDOOR_TYPES - PARTIAL_TYPES
+
+
+def classify_type(place_type: str) -> Optional[Exposure]:
+    if place_type in OUTDOOR_TYPES:
+        return OUTDOOR
+    if place_type in PARTIAL_TYPES:
+        return PARTIAL
+    if place_type in INDOOR_TYPES or place_type.endswith(INDOOR_SUFFIXES):
+        return INDOOR
+    return None
+
+
+def classify_place(types: List[str]) -> Exposure:
+    """
+    Exposición del primer tipo conocido; si ninguno lo es, parcialmente
+    cubierto.
+    """
+    for place_type in types or []:
+        if place_type in GENERIC_TYPES:
+            continue
+        exposure = classify_type(place_type)
+        if exposure is not None:
+            return exposure
+    return PARTIAL
+
+
+def _forecast_days(weather) -> List[Dict[str, Any]]:
+    # run_final_selection recibe [weather_result]
+    if isinstance(weather, list):
+        weather = weather[0] if weather else None
+    if not isinstance(weather, dict):
+        return []
+    return (weather.get("forecast") or {}).get("forecasts") or []
+
+
+def weather_risks(days: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Matriz (días x 3) con el riesgo de lluvia, calor y frío de cada día,
+    entre 0 y 1.
+    """
+    rain = np.array([day.get("rain") or 0 for day in days], dtype=float)
+    max_temp = np.array([(day.get("temperature") or {}).get("max_temp", 20) for day in days], dtype=float)
+    min_temp = np.array([(day.get("temperature") or {}).get("min_temp", 10) for day in days], dtype=float)
+    rain_words = np.array([any(w in (day.get("description") or "").lower() for w in RAIN_WORDS) for day in days])
+
+    rain_risk = np.clip((rain - LIGHT_RAIN_MM) / (HEAVY_RAIN_MM - LIGHT_RAIN_MM), 0, 1)
+    rain_risk = np.where(rain >= LIGHT_RAIN_MM, np.maximum(rain_risk, 0.5), rain_risk)
+    rain_risk = np.where(rain_words, np.maximum(rain_risk, 0.3), rain_risk)
+    # 0.5 justo en los umbrales de weather_summary, 1 a 3 °C más allá
+    heat_risk = np.clip((max_temp - (HOT_TEMP_C - 3)) / 6, 0, 1)
+    cold_risk = np.clip(((COLD_TEMP_C + 3) - min_temp) / 6, 0, 1)
+    return np.stack([rain_risk, heat_risk, cold_risk], axis=1)
+
+
+def _as_place(place: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Lugar en el formato de tourism_json.Place, venga de
+    places_api.search_places_fanout (name/address) o de la respuesta de un
+    LLM. Conserva el puntaje del ranking de la búsqueda si lo trae.
+    """
+    display_name = place.get("displayName") or {}
+    rating = place.get("rating")
+    score = place.get("score")
+    return {
+        "score": score if isinstance(score, (int, float)) else None,
+        "types": place.get("types") or [],
+        "formattedAddress": place.get("formattedAddress") or place.get("address") or "N/A",
+        "rating": rating if isinstance(rating, (int, float)) else None,
+        "displayName": {
+            "text": display_name.get("text") or place.get("name") or "",
+            "languageCode": display_name.get("languageCode") or "es"
+        }
+    }
+
+
+def select_places(places, weather, max_places: int = MAX_FINAL_PLACES) -> Dict[str, Any]:
+    """
+    Elige hasta `max_places` lugares según calificación y clima, sin LLM.
+
+    Cada lugar recibe un ajuste con el clima igual al de su mejor día del
+    pronóstico (1 - riesgo ponderado por su exposición), calculado para todos
+    los lugares y días a la vez. El puntaje final combina ese ajuste con la
+    calidad: el puntaje de places_api.rank_places (calificación, reseñas y
+    cercanía) o, si falta, la calificación sobre 5. Se limita a MAX_PER_TYPE
+    lugares por tipo principal.
+
+    Returns:
+        TourismAgentResponse como diccionario
+    """
+    if isinstance(places, dict):
+        places = places.get("places", [])
+    candidates = [_as_place(p) for p in places or [] if isinstance(p, dict)]
+    candidates = [p for p in candidates if p["displayName"]["text"]]
+    days = _forecast_days(weather)
+
+    if not candidates:
+        return TourismAgentResponse(places=[], weather_note="No se encontraron lugares para recomendar.").model_dump()
+
+    exposures = [classify_place(p["types"]) for p in candidates]
+    sensitivity = np.array([[e.rain, e.heat, e.cold] for e in exposures])
+    quality = np.array([
+        p["score"] if p["score"] is not None else (p["rating"] if p["rating"] is not None else 3.5) / 5
+        for p in candidates
+    ], dtype=float)
+
+    if days:
+        # (lugares x días): riesgo del día según la exposición del lugar
+        risk = np.clip(sensitivity @ weather_risks(days).T, 0, 1)
+        best_day = risk.argmin(axis=1)
+        fit = 1 - risk.min(axis=1)
+    else:
+        best_day = np.zeros(len(candidates), dtype=int)
+        fit = np.ones(len(candidates))
+
+    score = QUALITY_WEIGHT * quality + (1 - QUALITY_WEIGHT) * fit
+
+    chosen = []
+    per_type = {}
+    for i in np.argsort(-score, kind='stable'):
+        primary = next((t for t in candidates[i]["types"] if t not in GENERIC_TYPES), None)
+        if per_type.get(primary, 0) >= MAX_PER_TYPE:
+            continue
+        per_type[primary] = per_type.get(primary, 0) + 1
+        chosen.append(i)
+        if len(chosen) == max_places:
+            break
+
+    note = weather_note([candidates[i] for i in chosen], [exposures[i] for i in chosen],
+                        [int(best_day[i]) for i in chosen], days)
+    return TourismAgentResponse(places=[candidates[i] for i in chosen], weather_note=note).model_dump()
+
+
+def weather_note(places: List[Dict[str, Any]], exposures: List[Exposure], best_days: List[int],
+                 days: List[Dict[str, Any]]) -> str:
+    """
+    Nota de plantilla que explica la selección según el pronóstico.
+    """
+    if not days:
+        return "Sin pronóstico disponible: los lugares se eligieron por su calificación."
+
+    risks = weather_risks(days)
+    rainy = [day.get("date") for day, r in zip(days, risks) if r[0] >= 0.5]
+    hot = [day.get("date") for day, r in zip(days, risks) if r[1] >= 0.5]
+    cold = [day.get("date") for day, r in zip(days, risks) if r[2] >= 0.5]
+    indoor = [p["displayName"]["text"] for p, e in zip(places, exposures) if e is INDOOR]
+    outdoor = [(p["displayName"]["text"], days[d].get("date")) for p, e, d in zip(places, exposures, best_days)
+               if e is OUTDOOR]
+
+    parts = []
+    if rainy:
+        parts.append(f"lluvia el {', '.join(rainy)}")
+    if hot:
+        parts.append(f"calor fuerte el {', '.join(hot)}")
+    if cold:
+        parts.append(f"frío el {', '.join(cold)}")
+
+    if not parts:
+        note = "El pronóstico es favorable, así que se incluyen lugares al aire libre y bajo techo"
+    else:
+        note = "Se espera " + "; ".join(parts)
+        if indoor:
+            note += f". Se priorizan lugares bajo techo como {', '.join(indoor[:3])}"
+    if outdoor:
+        note += ". Mejor día para visitar " + ", ".join(f"{name}: {date}" for name, date in outdoor)
+    return note + "."
@@ -1,42 +1,61 @@
 import os
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
+import numpy as np
 import requests
 from crewai.tools import tool
 from dotenv import load_dotenv
 
+from cache import TTLCache, build_shared_backend
+from executors import http_executor, submit
+from geo import geohash_center, geohash_encode
+from http_client import HTTP_TIMEOUT, get_session
+from metrics import span
+
 env_path = Path(__file__).resolve().parents[1] / ".env"
 load_dotenv(dotenv_path=env_path)
 
 API_KEY = os.getenv('API_KEY_PLACES')
 radius = 11000
 
+# Celdas geohash de precisión 5 (~4.9 km de lado): con un radio de 11 km la
+# búsqueda desde el centro de la celda cubre cualquier punto dentro de ella
+PLACES_CACHE_PRECISION = int(os.getenv('PLACES_CACHE_PRECISION', '5'))
+PLACES_CACHE_TTL = int(os.getenv('PLACES_CACHE_TTL', str(7 * 24 * 60 * 60)))
+PLACES_CACHE_STALE_TTL = int(os.getenv('PLACES_CACHE_STALE_TTL', str(30 * 24 * 60 * 60)))
 
-@tool
-def search_places(categories: List[str], latitude: float, longitude: float):
-    """
-    Busca lugares turísticos cercanos basados en categorías específicas.
+# Una petición a searchNearby por cada grupo de categorías: si van todas
+# juntas, los tipos más populares se quedan con los 10 resultados
+PLACES_CATEGORIES_PER_REQUEST = int(os.getenv('PLACES_CATEGORIES_PER_REQUEST', '1'))
+# maxResultCount de cada petición (la API acepta hasta 20)
+PLACES_RESULTS_PER_REQUEST = int(os.getenv('PLACES_RESULTS_PER_REQUEST', '10'))
+# Lugares que se devuelven después de unir y ordenar
+PLACES_TOP_N = int(os.getenv('PLACES_TOP_N', '15'))
+# Pesos del puntaje: calificación, cantidad de reseñas y cercanía
+PLACES_RANK_WEIGHTS = (0.5, 0.3, 0.2)
 
-    Args:
-        categories: Lista de categorías a buscar (ej: ["cafe", "park", "museum"])
-        latitude: Latitud de la ubicación central
-        longitude: Longitud de la ubicación central
+places_cache = TTLCache("google_places", shared=build_shared_backend())
 
-    Returns:
-        JSON string con lugares encontrados
+
+def _search_nearby(categories: List[str], latitude: float, longitude: float) -> Optional[List[dict]]:
+    """
+    Llama a places:searchNearby. Devuelve None si la API falla o no responde
+    para que el error no quede guardado en la cache; en search_places_fanout
+    un grupo que falla no tumba a los demás.
     """
     url = 'https://places.googleapis.com/v1/places:searchNearby'
 
     headers = {
         'Content-Type': 'application/json',
         'X-Goog-Api-Key': API_KEY,
-        'X-Goog-FieldMask': 'places.displayName,places.formattedAddress,places.types,places.rating'
+        'X-Goog-FieldMask': 'places.id,places.displayName,places.formattedAddress,places.types,places.rating,'
+                            'places.userRatingCount,places.location'
     }
 
     body = {
         'includedTypes': categories,
-        'maxResultCount': 10,
+        'maxResultCount': PLACES_RESULTS_PER_REQUEST,
         'locationRestriction': {
             'circle': {
                 'center': {
@@ -48,48 +67,164 @@ def search_places(categories: List[str], latitude: float, longitude: float):
         }
     }
 
-    print("🔍 Buscando lugares...")
-    print(f"Tipos: {', '.join(categories)}")
-    print(f"Ubicación: {latitude}, {longitude}")
-    print(f"Radio: {radius}m\n")
+    try:
+        with span("places.search_nearby"):
+            response = get_session().post(url, headers=headers, json=body, timeout=HTTP_TIMEOUT)
+
+        if response.status_code != 200:
+            print(f"❌ Error {response.status_code}")
+            print(response.text)
+            return None
+
+        found = response.json().get('places', [])
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Error buscando {', '.join(categories)}: {e}")
+        return None
+
+    return [
+        {
+            'id': place.get('id'),
+            'name': place['displayName']['text'],
+            'address': place.get('formattedAddress', 'N/A'),
+            'rating': place.get('rating', 'N/A'),
+            'user_rating_count': place.get('userRatingCount', 0),
+            'latitude': place.get('location', {}).get('latitude'),
+            'longitude': place.get('location', {}).get('longitude'),
+            'types': place.get('types', [])
+        }
+        for place in found
+    ]
 
-    response = requests.post(url, headers=headers, json=body)
 
-    if response.status_code == 200:
-        data = response.json()
+def search_places_cached(categories: List[str], latitude: float, longitude: float) -> List[dict]:
+    """
+    Busca lugares pasando por la cache. La llave es la celda geohash del punto
+    más el conjunto ordenado de categorías, y la búsqueda se hace desde el
+    centro de la celda para que cualquier coordenada cercana reciba el mismo
+    resultado.
+    """
+    if latitude is None or longitude is None:
+        return _search_nearby(categories, latitude, longitude) or []
+
+    cell = geohash_encode(latitude, longitude, PLACES_CACHE_PRECISION)
+    categories = sorted(set(categories))
+    # v2: las entradas incluyen id, reseñas y ubicación para el ranking
+    key = f"places:v2|{cell}|{','.join(categories)}"
+    center_lat, center_lon = geohash_center(cell)
 
-        if 'places' in data:
-            places_found = []
-            print(f"✅ Encontrados {len(data['places'])} lugares:\n")
+    places = places_cache.get_or_fetch(
+        key,
+        lambda: _search_nearby(categories, center_lat, center_lon),
+        PLACES_CACHE_TTL,
+        stale_ttl=PLACES_CACHE_STALE_TTL
+    )
+    return places or []
 
-            for i, place in enumerate(data['places'], 1):
-                nombre = place['displayName']['text']
-                direccion = place.get('formattedAddress', 'N/A')
-                rating = place.get('rating', 'N/A')
-                tipos = ', '.join(place.get('types', [])[:2])
 
-                print(f"{i}. {nombre}")
-                print(f"   📍 {direccion}")
-                print(f"   ⭐ {rating}")
-                print(f"   🏷️  {tipos}\n")
+def group_categories(categories: List[str], size: int = PLACES_CATEGORIES_PER_REQUEST) -> List[List[str]]:
+    unique = sorted(set(categories))
+    return [unique[i:i + size] for i in range(0, len(unique), max(size, 1))]
 
-                places_found.append({
-                    'name': nombre,
-                    'address': direccion,
-                    'rating': rating,
-                    'types': place.get('types', [])
-                })
 
-            return places_found
+def rank_places(places: List[dict], latitude: Optional[float], longitude: Optional[float],
+                top_n: int = PLACES_TOP_N) -> List[dict]:
+    """
+    Ordena por un puntaje entre 0 y 1 que combina calificación (sobre 5),
+    cantidad de reseñas (log, relativa al máximo del grupo) y cercanía
+    (1 en el centro, 0 en el borde del radio), y devuelve los `top_n`
+    primeros. Los datos que faltan puntúan 0.
+    """
+    if not places:
+        return []
 
-        else:
-            print("❌ No se encontraron lugares")
-            return []
+    rating = np.array([p['rating'] if isinstance(p.get('rating'), (int, float)) else np.nan for p in places],
+                      dtype=float)
+    reviews = np.log1p(np.array([p.get('user_rating_count') or 0 for p in places], dtype=float))
+    lat = np.array([p.get('latitude') if p.get('latitude') is not None else np.nan for p in places], dtype=float)
+    lon = np.array([p.get('longitude') if p.get('longitude') is not None else np.nan for p in places], dtype=float)
+
+    if latitude is not None and longitude is not None:
+        # Haversine en metros
+        lat1, lon1, lat2, lon2 = map(np.radians, (latitude, longitude, lat, lon))
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        distance = 2 * 6371000 * np.arcsin(np.sqrt(a))
+        proximity = np.nan_to_num(np.clip(1 - distance / radius, 0, 1))
     else:
-        print(f"❌ Error {response.status_code}")
-        print(response.text)
+        distance = np.full(len(places), np.nan)
+        proximity = np.zeros(len(places))
+
+    w_rating, w_reviews, w_proximity = PLACES_RANK_WEIGHTS
+    score = (w_rating * np.nan_to_num(rating) / 5
+             + w_reviews * (reviews / reviews.max() if reviews.max() > 0 else reviews)
+             + w_proximity * proximity)
+
+    # Orden estable: a igual puntaje se respeta el orden de la API
+    order = np.argsort(-score, kind='stable')[:top_n]
+    return [
+        {**places[i], 'distance_km': None if np.isnan(distance[i]) else round(float(distance[i]) / 1000, 2),
+         'score': round(float(score[i]), 3)}
+        for i in order
+    ]
+
+
+def search_places_fanout(categories: List[str], latitude: float, longitude: float,
+                         top_n: int = PLACES_TOP_N) -> List[dict]:
+    """
+    Una búsqueda (con cache) por cada grupo de categorías, en paralelo sobre
+    la sesión compartida; une los resultados sin repetir lugares y devuelve
+    los `top_n` mejor puntuados. Tarda lo que la búsqueda más lenta.
+    """
+    groups = group_categories(categories)
+    if not groups:
         return []
 
+    futures = [submit(http_executor, search_places_cached, group, latitude, longitude) for group in groups[1:]]
+    results = [search_places_cached(groups[0], latitude, longitude)] + [future.result() for future in futures]
+
+    merged = {}
+    for places in results:
+        for place in places:
+            # Entradas sin id (cache anterior): por nombre y dirección
+            key = place.get('id') or (place['name'], place['address'])
+            merged.setdefault(key, place)
+
+    return rank_places(list(merged.values()), latitude, longitude, top_n)
+
+
+@tool
+def search_places(categories: List[str], latitude: float, longitude: float):
+    """
+    Busca lugares turísticos cercanos basados en categorías específicas.
+
+    Args:
+        categories: Lista de categorías a buscar (ej: ["cafe", "park", "museum"])
+        latitude: Latitud de la ubicación central
+        longitude: Longitud de la ubicación central
+
+    Returns:
+        JSON string con lugares encontrados
+    """
+    print("🔍 Buscando lugares...")
+    print(f"Tipos: {', '.join(categories)}")
+    print(f"Ubicación: {latitude}, {longitude}")
+    print(f"Radio: {radius}m\n")
+
+    places_found = search_places_fanout(categories, latitude, longitude)
+
+    if not places_found:
+        print("❌ No se encontraron lugares")
+        return []
+
+    print(f"✅ Encontrados {len(places_found)} lugares:\n")
+
+    for i, place in enumerate(places_found, 1):
+        print(f"{i}. {place['name']}")
+        print(f"   📍 {place['address']}")
+        print(f"   ⭐ {place['rating']}")
+        print(f"   🏷️  {', '.join(place['types'][:2])}\n")
+
+    return places_found
+
 
 if __name__ == "__main__":
     categories1 = ['restaurant', 'cafe']
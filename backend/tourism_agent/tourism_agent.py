@@ -1,12 +1,16 @@
+import json
 import os
 from pathlib import Path
 
 from crewai import Agent, Task, Crew, LLM
 from dotenv import load_dotenv
-from typing import Any
+from typing import Any, List
 
-from .places_api import search_places
-from .tourism_json import ReportInterests, PlacesReport, TourismAgentResponse
+from metrics import TaskTimer, span
+
+from . import category_matcher, place_selector
+from .places_api import search_places_fanout
+from .tourism_json import ReportInterests, TourismAgentResponse
 from .tourism_tools import read_categories_file
 
 env_path = Path(__file__).resolve().parents[1] / ".env"
@@ -19,17 +23,21 @@ llm = LLM(
     api_version="2024-12-01-preview"
 )
 
+# rules: la selección final se hace con place_selector (sin LLM); llm: con
+# la Task select_final_places
+TOURISM_SELECTION_MODE = os.getenv('TOURISM_SELECTION_MODE', 'rules')
+
 tourism_agent = Agent(
     role="Experto en Turismo",
     goal="Analizar intereses del usuario y encontrar lugares turísticos relevantes cercanos",
     backstory="""Eres un agente especializado en turismo que:
     1. Lee catálogos de categorías turísticas
     2. Analiza intereses de usuarios y encuentra las mejores coincidencias
-    3. Busca lugares específicos que se alineen con esas preferencias
+    3. Elige entre los lugares encontrados los más acordes al clima
 
     Trabajas de forma metódica y precisa, usando las herramientas disponibles.""",
     llm=llm,
-    tools=[read_categories_file, search_places],
+    tools=[read_categories_file],
     verbose=True
 )
 
@@ -55,64 +63,75 @@ task_select_categories = Task(
     context=[task_read_categories]
 )
 
-task_search_places = Task(
-    description="""Utiliza las categorías seleccionadas en el paso anterior.
-
-    Llama a la herramienta 'search_places' con:
-    - categories: las categorías de la tarea anterior
-    - latitude: {latitude}
-    - longitude: {longitude}
-
-    Realiza una única búsqueda con estos parámetros.""",
-    expected_output="Lista JSON de lugares encontrados",
-    agent=tourism_agent,
-    context=[task_select_categories],
-    output_pydantic=PlacesReport,
-    tools=[search_places]
-)
-
+# Recibe los lugares como input (no como context) para que la búsqueda pueda
+# correr antes de tener el clima
 select_final_places = Task(
-    description="""Utiliza los lugares seleccionados en el paso anterior.
+    description="""Utiliza los lugares encontrados: {places}
     Analiza los lugares encontrados y selecciona SOLO los más acordes segun el clima
     y pronosticos futuros usando {weather}. (maximo 5 lugares).""",
     expected_output="""Lista JSON de lugares finales recomendados con una nota al final pero dentro del JSON del todo del porque 
                     fueron seleccionados esos lugares con base al clima.""",
     agent=tourism_agent,
-    context=[task_search_places],
     output_pydantic=TourismAgentResponse,
     tools=[]
 )
 
-crew = Crew(
+# Las categorías solo dependen de los intereses, así que este crew puede
+# correr mientras el agente del clima sigue trabajando
+category_crew = Crew(
+    agents=[tourism_agent],
+    tasks=[task_read_categories, task_select_categories],
+    verbose=True
+)
+
+selection_crew = Crew(
     agents=[tourism_agent],
-    tasks=[task_read_categories, task_select_categories, task_search_places, select_final_places],
+    tasks=[select_final_places],
     verbose=True
 )
 
 
-def run_tourism_category_selector(user_interests: list, latitude: float, longitude: float, weather: list[Any]):
+def run_category_selection(user_interests: list) -> List[str]:
     """
-    Ejecuta el flujo completo de selección de turismo.
+    Selecciona las categorías de Google Places que coinciden con los intereses.
+
+    Primero usa el índice local de category_matcher; el crew con LLM solo se
+    ejecuta cuando algún interés no se pudo resolver con suficiente confianza.
 
     Args:
         user_interests: Lista de intereses del usuario
-        latitude: Latitud de la ubicación
-        longitude: Longitud de la ubicación
-        weather: Datos del clima y pronóstico
 
     Returns:
-        Diccionario con los resultados o string con output raw
+        Lista con los nombres exactos de las categorías seleccionadas
     """
+    match = category_matcher.match_interests(user_interests)
+    if match.categories and match.confidence >= category_matcher.MIN_CONFIDENCE:
+        print(f"Categorías resueltas localmente (confianza {match.confidence:.2f}): {match.categories}")
+        return match.categories
+
+    print(f"Confianza baja ({match.confidence:.2f}) para {match.unmatched or user_interests}, usando el LLM")
     interests_str = ", ".join(user_interests)
 
-    tourism_result = crew.kickoff(inputs={
-        'user_interests': interests_str,
-        'latitude': latitude,
-        'longitude': longitude,
-        'weather': weather
+    # Copia del crew por ejecución: los Task guardan su salida y el worker
+    # corre varios itinerarios a la vez
+    crew = category_crew.copy()
+    crew.task_callback = TaskTimer("tourism", ["read_categories", "select_categories"])
+    category_result = crew.kickoff(inputs={
+        'user_interests': interests_str
     })
 
-    last_task_output = select_final_places.output
+    last_task_output = category_result.tasks_output[-1]
+
+    if last_task_output.pydantic:
+        return last_task_output.pydantic.selected_categories
+    elif last_task_output.json_dict:
+        return last_task_output.json_dict.get('selected_categories', [])
+    else:
+        return []
+
+
+def _crew_output(result):
+    last_task_output = result.tasks_output[-1]
 
     if last_task_output.pydantic:
         return last_task_output.pydantic.model_dump()
@@ -120,3 +139,82 @@ def run_tourism_category_selector(user_interests: list, latitude: float, longitu
         return last_task_output.json_dict
     else:
         return last_task_output.raw
+
+
+def run_places_search(selected_categories: List[str], latitude: float, longitude: float):
+    """
+    Busca lugares para las categorías dadas; no depende del clima.
+
+    Llama directamente a places_api.search_places_fanout: la búsqueda no
+    necesita al LLM, y así los lugares conservan id, reseñas, distancia y el
+    puntaje del ranking para la selección final.
+
+    Returns:
+        Diccionario con la lista 'places'
+    """
+    return {'places': search_places_fanout(selected_categories, latitude, longitude)}
+
+
+def run_final_selection(places, weather: list[Any], mode=None):
+    """
+    Elige entre los lugares encontrados los más acordes al clima.
+
+    Args:
+        places: Salida de run_places_search
+        weather: Datos del clima y pronóstico
+        mode: 'rules' o 'llm'; por defecto TOURISM_SELECTION_MODE
+
+    Returns:
+        Diccionario TourismAgentResponse o string con output raw
+    """
+    if isinstance(places, str):
+        try:
+            places = json.loads(places)
+        except ValueError:
+            pass
+
+    # Si la búsqueda no devolvió JSON se deja que el LLM interprete el texto
+    if (mode or TOURISM_SELECTION_MODE) == 'rules' and isinstance(places, (dict, list)):
+        with span("tourism.select_final_places"):
+            return place_selector.select_places(places, weather)
+
+    crew = selection_crew.copy()
+    crew.task_callback = TaskTimer("tourism", ["select_final_places"])
+    return _crew_output(crew.kickoff(inputs={
+        'places': json.dumps(places, ensure_ascii=False) if not isinstance(places, str) else places,
+        'weather': weather
+    }))
+
+
+def run_places_selection(selected_categories: List[str], latitude: float, longitude: float, weather: list[Any]):
+    """
+    Busca lugares para las categorías dadas y elige los más acordes al clima.
+
+    Args:
+        selected_categories: Categorías devueltas por run_category_selection
+        latitude: Latitud de la ubicación
+        longitude: Longitud de la ubicación
+        weather: Datos del clima y pronóstico
+
+    Returns:
+        Diccionario con los resultados o string con output raw
+    """
+    places = run_places_search(selected_categories, latitude, longitude)
+    return run_final_selection(places, weather)
+
+
+def run_tourism_category_selector(user_interests: list, latitude: float, longitude: float, weather: list[Any]):
+    """
+    Ejecuta el flujo completo de selección de turismo.
+
+    Args:
+        user_interests: Lista de intereses del usuario
+        latitude: Latitud de la ubicación
+        longitude: Longitud de la ubicación
+        weather: Datos del clima y pronóstico
+
+    Returns:
+        Diccionario con los resultados o string con output raw
+    """
+    selected_categories = run_category_selection(user_interests)
+    return run_places_selection(selected_categories, latitude, longitude, weather)
@@ -19,10 +19,6 @@ class Place(BaseModel):
     displayName: DisplayName = Field(description="Objeto con el nombre y código de idioma del lugar")
 
 
-class PlacesReport(BaseModel):
-    places: List[Place] = Field(description="Lista de lugares encontrados en la búsqueda")
-
-
 ##Itinerario JSON model
 
 class TourismAgentResponse(BaseModel):
@@ -1,11 +1,13 @@
 # --- Config del modelo (MODELOS CON MÁS TOKENS) ---
 # IMPORTANTE: Usa AutoModelForCausalLM (NO Seq2SeqLM)
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-from langchain_huggingface import HuggingFacePipeline
+# transformers, torch y langchain_huggingface se importan al cargar el modelo:
+# importar este módulo no descarga ni carga nada
 from langchain_core.prompts import PromptTemplate  # ✅ CORRECTO
 from langchain_core.output_parsers import StrOutputParser
 import json
+import os
 import sys
+import threading
 from pathlib import Path
 
 # model_name = "meta-llama/Llama-3.2-3B-Instruct"
@@ -17,45 +19,130 @@ from pathlib import Path
 # model_name = "Qwen/Qwen2.5-3B-Instruct"
 # max_length = 32768
 
-model_name = "Qwen/Qwen3-4B-Instruct-2507"
+model_name = os.getenv('TRANSFORMER_MODEL', "Qwen/Qwen3-4B-Instruct-2507")
 max_length = 32768
 
-# Cargar tokenizer explícitamente
-tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-
-# Pipeline con configuración mejorada
-pipe = pipeline(
-    "text-generation",
-    model=model_name,
-    tokenizer=tokenizer,
-    device_map="auto",
-    torch_dtype="auto",
-    trust_remote_code=True,  # Importante para modelos Qwen
-    model_kwargs={
+# auto: dtype del checkpoint; bfloat16: mitad de memoria, sirve en CPU moderna;
+# int8: bitsandbytes con GPU o cuantización dinámica de las capas Linear en CPU
+TRANSFORMER_DTYPE = os.getenv('TRANSFORMER_DTYPE', 'auto')
+
+# Registro del proceso: tokenizer y pesos se cargan por separado y una sola vez
+_tokenizer = None
+_pipe = None
+_chain = None
+_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """
+    Tokenizer del modelo (unos MB); no carga los pesos.
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        with _lock:
+            if _tokenizer is None:
+                from transformers import AutoTokenizer
+
+                tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+                # Para generar en lotes con un modelo causal el padding va a la izquierda
+                tokenizer.padding_side = "left"
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+                _tokenizer = tokenizer
+    return _tokenizer
+
+
+def _load_model():
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    model_kwargs = {
+        "trust_remote_code": True,  # Importante para modelos Qwen
         "low_cpu_mem_usage": True,
         "use_cache": True  # Acelera generación
     }
-)
 
-# Parámetros de generación optimizados
-generation_params = {
-    "max_new_tokens": 2048,
-    "temperature": 0.7,
-    "top_p": 0.9,
-    "top_k": 50,
-    "repetition_penalty": 1.1,
-    "do_sample": True,
-    "num_return_sequences": 1,
-    "pad_token_id": tokenizer.pad_token_id or tokenizer.eos_token_id,
-    "eos_token_id": tokenizer.eos_token_id,
-    "return_full_text": False  # CRÍTICO: Solo devuelve texto generado
-}
-
-# HuggingFacePipeline con parámetros
-llm = HuggingFacePipeline(
-    pipeline=pipe,
-    model_kwargs=generation_params
-)
+    if TRANSFORMER_DTYPE == 'int8':
+        if torch.cuda.is_available():
+            from transformers import BitsAndBytesConfig
+
+            return AutoModelForCausalLM.from_pretrained(
+                model_name,
+                device_map="auto",
+                quantization_config=BitsAndBytesConfig(load_in_8bit=True),
+                **model_kwargs
+            )
+        # Nodos sin GPU: pesos en float32 y Linear cuantizadas a int8
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32, **model_kwargs)
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    torch_dtype = torch.bfloat16 if TRANSFORMER_DTYPE == 'bfloat16' else "auto"
+    return AutoModelForCausalLM.from_pretrained(model_name, device_map="auto", torch_dtype=torch_dtype,
+                                                **model_kwargs)
+
+
+def get_pipeline():
+    """
+    Pipeline de generación; los pesos se cargan en la primera llamada.
+    """
+    global _pipe
+    if _pipe is None:
+        tokenizer = get_tokenizer()
+        with _lock:
+            if _pipe is None:
+                from transformers import pipeline
+
+                print(f"Cargando {model_name} ({TRANSFORMER_DTYPE})...")
+                _pipe = pipeline("text-generation", model=_load_model(), tokenizer=tokenizer)
+    return _pipe
+
+
+def generation_params():
+    """
+    Parámetros de generación optimizados
+    """
+    tokenizer = get_tokenizer()
+    return {
+        "max_new_tokens": 2048,
+        "temperature": 0.7,
+        "top_p": 0.9,
+        "top_k": 50,
+        "repetition_penalty": 1.1,
+        "do_sample": True,
+        "num_return_sequences": 1,
+        "pad_token_id": tokenizer.pad_token_id or tokenizer.eos_token_id,
+        "eos_token_id": tokenizer.eos_token_id,
+        "return_full_text": False  # CRÍTICO: Solo devuelve texto generado
+    }
+
+
+def get_chain():
+    global _chain
+    if _chain is None:
+        pipe = get_pipeline()
+        params = generation_params()
+        with _lock:
+            if _chain is None:
+                from langchain_huggingface import HuggingFacePipeline
+
+                # HuggingFacePipeline con parámetros
+                llm = HuggingFacePipeline(
+                    pipeline=pipe,
+                    model_kwargs=params
+                )
+                _chain = prompt | llm | StrOutputParser()
+    return _chain
+
+
+def warm_up():
+    """
+    Carga tokenizer y pesos y hace una generación corta, para pagar ese costo
+    al arrancar el proceso y no en la primera petición.
+    """
+    params = dict(generation_params(), max_new_tokens=1)
+    get_pipeline()("Hola", **params)
+    print(f"{model_name} listo")
+
 
 # Prompt mejorado (más conciso y directo)
 prompt = PromptTemplate.from_template(
@@ -87,15 +174,12 @@ Día 1 ([fecha]):
 Responde ÚNICAMENTE con el itinerario, sin preámbulos."""
 )
 
-# Chain
-chain = prompt | llm | StrOutputParser()
-
 
 def check_token_length(text):
     """
     Verifica la longitud del texto en tokens.
     """
-    tokens = tokenizer.encode(text, truncation=False)
+    tokens = get_tokenizer().encode(text, truncation=False)
     token_count = len(tokens)
     print(f"📊 Longitud del JSON: {token_count} tokens (máximo: {max_length})")
 
@@ -107,6 +191,35 @@ def check_token_length(text):
     return True
 
 
+def clean_output(result):
+    """
+    Limpia la respuesta - extrae solo la parte del asistente
+    """
+    if "<|im_start|>assistant" in result:
+        result = result.split("<|im_start|>assistant")[-1].strip()
+    if "<|im_end|>" in result:
+        result = result.split("<|im_end|>")[0].strip()
+    if "Texto conversacional:" in result:
+        result = result.split("Texto conversacional:")[-1].strip()
+    return result
+
+
+def generate_batch(json_blobs):
+    """
+    Genera un itinerario por cada JSON en una sola pasada del pipeline,
+    rellenando los prompts al mismo largo.
+
+    Args:
+        json_blobs: Lista de JSON (texto) con clima y lugares
+
+    Returns:
+        Lista con el texto generado para cada JSON, en el mismo orden
+    """
+    texts = [prompt.format(json_blob=json_blob) for json_blob in json_blobs]
+    outputs = get_pipeline()(texts, batch_size=len(texts), **generation_params())
+    return [clean_output(output[0]["generated_text"]) for output in outputs]
+
+
 def process_json_file(json_path):
     """
     Lee un archivo JSON y lo convierte en texto conversacional.
@@ -137,17 +250,9 @@ def process_json_file(json_path):
     print("🤖 Generando texto conversacional...\n")
 
     try:
-        result = chain.invoke({"json_blob": json_blob})
-
-        # Limpiar la respuesta - extraer solo la parte del asistente
-        if "<|im_start|>assistant" in result:
-            result = result.split("<|im_start|>assistant")[-1].strip()
-        if "<|im_end|>" in result:
-            result = result.split("<|im_end|>")[0].strip()
-        if "Texto conversacional:" in result:
-            result = result.split("Texto conversacional:")[-1].strip()
+        result = get_chain().invoke({"json_blob": json_blob})
 
-        return result
+        return clean_output(result)
 
     except Exception as e:
         print(f"❌ Error al generar texto: {e}")
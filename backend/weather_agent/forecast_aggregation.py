@@ -0,0 +1,70 @@
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def aggregate_daily(slots: List[Dict[str, Any]], timezone_offset: int = 0) -> List[Dict[str, Any]]:
+    """
+    Agrupa los bloques de 3 horas de /forecast en una fila por día calendario
+    local de la ciudad.
+
+    Args:
+        slots: bloques con dt (epoch UTC), description, temp, temp_min,
+            temp_max, wind_speed, humidity, clouds y rain
+        timezone_offset: desfase en segundos respecto a UTC (city.timezone)
+
+    Returns:
+        Filas con los campos de DailyForecast (sin summary), ordenadas por fecha
+    """
+    if not slots:
+        return []
+
+    local_time = np.array([s["dt"] for s in slots], dtype=np.int64) + timezone_offset
+    order = np.argsort(local_time, kind="stable")
+    local_day = local_time[order] // SECONDS_PER_DAY
+
+    def column(field):
+        return np.array([slots[i].get(field) or 0 for i in order], dtype=np.float64)
+
+    temp = column("temp")
+    temp_min = column("temp_min")
+    temp_max = column("temp_max")
+    wind = column("wind_speed")
+    humidity = column("humidity")
+    clouds = column("clouds")
+    rain = column("rain")
+
+    # Los bloques quedan ordenados, así que cada día es un tramo contiguo
+    starts = np.flatnonzero(np.r_[True, local_day[1:] != local_day[:-1]])
+    counts = np.diff(np.r_[starts, len(local_day)])
+
+    day_min = np.minimum.reduceat(temp_min, starts)
+    day_max = np.maximum.reduceat(temp_max, starts)
+    day_mean = np.add.reduceat(temp, starts) / counts
+    day_wind = np.maximum.reduceat(wind, starts)
+    day_humidity = np.add.reduceat(humidity, starts) / counts
+    day_clouds = np.add.reduceat(clouds, starts) / counts
+    day_rain = np.add.reduceat(rain, starts)
+
+    rows = []
+    for n, (start, count) in enumerate(zip(starts, counts)):
+        descriptions = Counter(slots[i]["description"] for i in order[start:start + count])
+        date = datetime.fromtimestamp(int(local_day[start]) * SECONDS_PER_DAY, tz=timezone.utc).date()
+        rows.append({
+            "date": date.isoformat(),
+            "description": descriptions.most_common(1)[0][0],
+            "temperature": {
+                "min_temp": round(float(day_min[n]), 1),
+                "max_temp": round(float(day_max[n]), 1),
+                "mean_temp": round(float(day_mean[n]), 1),
+            },
+            "wind_speed": round(float(day_wind[n]), 1),
+            "humidity": int(round(day_humidity[n])),
+            "clouds": int(round(day_clouds[n])),
+            "rain": round(float(day_rain[n]), 1),
+        })
+    return rows
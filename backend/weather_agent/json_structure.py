@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
 from pydantic import BaseModel, Field
 
@@ -6,6 +6,7 @@ from pydantic import BaseModel, Field
 class Temperature(BaseModel):
     min_temp: float
     max_temp: float
+    mean_temp: Optional[float] = None
 
 
 class DailyForecast(BaseModel):
@@ -15,6 +16,7 @@ class DailyForecast(BaseModel):
     wind_speed: float = Field(description="from API")
     humidity: int = Field(description="from API")
     clouds: int = Field(description="from API")
+    rain: float = Field(default=0, description="from API")
     summary: str = Field(description="YOUR ONE-SENTENCE RECOMMENDATION HERE")
 
 
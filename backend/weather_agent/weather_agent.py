@@ -1,11 +1,15 @@
+import json
 import os
 from pathlib import Path
 
 from crewai import Agent, Task, Crew, LLM
 from dotenv import load_dotenv
 
-from .json_structure import WeatherReport
-from .weather_api import get_weather, get_forecast_weather
+from metrics import TaskTimer
+
+from .json_structure import DailyForecast, ForecastReport, WeatherReport
+from .weather_api import fetch_weather_bundle, get_weather, get_forecast_weather
+from .weather_summary import summarize_day
 
 env_path = Path(__file__).resolve().parents[1] / ".env"
 load_dotenv(dotenv_path=env_path)
@@ -17,25 +21,38 @@ llm = LLM(
     api_version="2024-12-01-preview"
 )
 
+# fast: el WeatherReport se arma directo con los datos de la API y resúmenes
+# por reglas; llm: el crew redacta los resúmenes de cada día
+WEATHER_AGENT_MODE = os.getenv('WEATHER_AGENT_MODE', 'fast')
+
 info_agent = Agent(
     role="Weather Forecast Expert",
     goal="""Analyze and provide detailed and accurate weather forecasts for {destination} for the specified {time_range},
          delivering comprehensive meteorological information in a structured and easy-to-interpret JSON format.""",
     backstory="""You are a meteorologist who ALWAYS uses weather APIs to get accurate, real-time data. 
-       You NEVER make up or invent weather data. You MUST use the get_weather and get_forecast_weather tools 
-       to retrieve actual weather information from OpenWeatherMap API.""",
+       You NEVER make up or invent weather data. You work with the data returned by the get_weather and
+       get_forecast_weather tools from OpenWeatherMap API, which is usually provided to you already.""",
     llm=llm,
     tools=[get_weather, get_forecast_weather],
     # verbose=True,
 )
 
 task1 = Task(
-    description="""Retrieve real weather data using the provided tools and add your expert analysis.
+    description="""Use the real weather data already retrieved from OpenWeatherMap for {destination}
+    ({time_range} days) and add your expert analysis.
+
+    CURRENT WEATHER (result of get_weather):
+    {current_weather}
+
+    FORECAST (result of get_forecast_weather, already one row per local day):
+    {forecast_weather}
 
     REQUIRED ACTIONS:
-    1. Call get_weather(city="{destination}") to get current conditions
-    2. Call get_forecast_weather(place="{destination}", days={time_range}) to get forecast
+    1. Use the CURRENT WEATHER above as the "current" section, unchanged
+    2. Use the FORECAST above for the forecast section
     3. ANALYZE the API data and ADD a "summary" field to EACH forecast item with your recommendation
+    Only if a section above is null, call get_weather(city="{destination}") or
+    get_forecast_weather(place="{destination}", days={time_range}) to retrieve it.
 
     CRITICAL INSTRUCTIONS FOR SUMMARIES:
     - For EACH item in the forecasts array, ADD a new field called "summary"
@@ -47,7 +64,7 @@ task1 = Task(
       * "Strong winds expected, not recommended for outdoor events."
 
     IMPORTANT: 
-    - You MUST use both tools to get real API data
+    - You MUST use the real API data above (or the tools if it is null)
     - Do NOT invent weather numbers (temp, humidity, etc.)
     - DO add your expert summary/recommendation to each forecast
     - The dates in the forecast come from OpenWeatherMap API""",
@@ -61,10 +78,11 @@ task1 = Task(
                 {
                     "date": "from API",
                     "description": "from API",
-                    "temperature": {"min_temp": X, "max_temp": Y},
+                    "temperature": {"min_temp": X, "max_temp": Y, "mean_temp": Z},
                     "wind_speed": "from API",
                     "humidity": "from API",
                     "clouds": "from API",
+                    "rain": "from API",
                     "summary": "YOUR ONE-SENTENCE RECOMMENDATION HERE"
                 },
                 ... more forecasts with summary in each one
@@ -84,10 +102,39 @@ crew = Crew(
 )
 
 
-def run_weather_forecast(destination, time_range):
-    weather_result = crew.kickoff(inputs={
+def build_weather_report(destination, current_weather, forecast_weather):
+    """
+    Construye el WeatherReport sin LLM: un DailyForecast por día con el
+    resumen generado por weather_summary.
+    """
+    forecasts = [
+        DailyForecast(**day, summary=summarize_day(day))
+        for day in forecast_weather["forecasts"]
+    ]
+    report = WeatherReport(
+        current=current_weather,
+        forecast=ForecastReport(city=current_weather.get("name", destination), forecasts=forecasts)
+    )
+    return report.model_dump()
+
+
+def run_weather_forecast(destination, time_range, mode=None):
+    # Los datos se consultan antes del crew y en paralelo, así el LLM no
+    # gasta turnos llamando herramientas una tras otra
+    current_weather, forecast_weather = fetch_weather_bundle(destination, time_range)
+
+    if (mode or WEATHER_AGENT_MODE) == 'fast' and current_weather and forecast_weather:
+        return build_weather_report(destination, current_weather, forecast_weather)
+
+    # Copia del crew por ejecución: los Task guardan su salida y el worker
+    # corre varios itinerarios a la vez
+    weather_crew = crew.copy()
+    weather_crew.task_callback = TaskTimer("weather", ["forecast_report"])
+    weather_result = weather_crew.kickoff(inputs={
         'destination': destination,
-        'time_range': time_range
+        'time_range': time_range,
+        'current_weather': json.dumps(current_weather, ensure_ascii=False),
+        'forecast_weather': json.dumps(forecast_weather, ensure_ascii=False)
     })
 
     if weather_result.pydantic:
@@ -1,65 +1,89 @@
 import os
+import time
 from pathlib import Path
+from typing import Optional, Tuple
 
 import requests
 from crewai.tools import tool
 from dotenv import load_dotenv
 
+from cache import TTLCache, build_shared_backend, normalize_text
+from executors import http_executor, submit
+from gazetteer import gazetteer
+from metrics import span
+from .forecast_aggregation import aggregate_daily
+from http_client import HTTP_TIMEOUT, get_session
+
 env_path = Path(__file__).resolve().parents[1] / ".env"
 load_dotenv(dotenv_path=env_path)
 
-@tool
-def get_forecast_weather(place: str, days: int):
-    """
-    MANDATORY TOOL: Get REAL weather forecast from OpenWeatherMap API.
+# OpenWeatherMap recalcula el pronóstico de 5 días cada 3 horas y el clima
+# actual cada ~10 minutos; las entradas de cache vencen con esos ciclos.
+FORECAST_REFRESH_SECONDS = int(os.getenv('WEATHER_FORECAST_TTL', str(3 * 60 * 60)))
+CURRENT_REFRESH_SECONDS = int(os.getenv('WEATHER_CURRENT_TTL', str(10 * 60)))
 
-    This tool makes an actual API call to get future weather predictions.
-    DO NOT invent forecast data. ALWAYS use this tool.
+weather_cache = TTLCache("openweather", shared=build_shared_backend())
 
-    Args:
-        place: City name (e.g., "Tunja, CO", "Bogotá")
-        days: Number of days to forecast (1-5, API provides data every 3 hours)
 
-    Returns:
-        dict: Real forecast data from API with list of predictions including:
-            - date (dt_txt): actual date and time from API
-            - description: weather description
-            - temperature: min and max temperatures
-            - wind_speed: wind speed
-
-    Example usage:
-        get_forecast_weather(place="Tunja, CO", days=3)
+def _fetch_openweather(endpoint: str, city: str, refresh_seconds: int):
     """
-
-    parameters = {
-        "q": place,
-        "appid": os.getenv("WEATHER_API"),
-        "units": "metric",
-        "lang": "es"
-    }
-
-    try:
-        response = requests.get("https://api.openweathermap.org/data/2.5/forecast", params=parameters)
+    Consulta /weather o /forecast pasando por la cache. La llave usa el nombre
+    normalizado de la ciudad y la ventana de actualización actual, así que una
+    entrada nunca sobrevive al siguiente recálculo de OpenWeatherMap.
+    """
+    now = time.time()
+    window = int(now // refresh_seconds)
+    key = f"{endpoint}|{normalize_text(city)}|{window}"
+    ttl = refresh_seconds - (now % refresh_seconds)
+
+    def fetch():
+        parameters = {
+            "q": city,
+            "appid": os.getenv("WEATHER_API"),
+            "units": "metric",
+            "lang": "es"
+        }
+        with span(f"openweather.{endpoint}"):
+            response = get_session().get(f"https://api.openweathermap.org/data/2.5/{endpoint}", params=parameters,
+                                         timeout=HTTP_TIMEOUT)
         response.raise_for_status()
+        return response.json()
 
-        data = response.json()
+    return weather_cache.get_or_fetch(key, fetch, ttl)
 
-        out_data = {
-            "forecasts": []
-        }
 
-        for item in data['list'][:days * 8]:
-            forecast = {
-                "date": item["dt_txt"],
+def fetch_forecast(place: str, days: int):
+    """
+    Pronóstico de OpenWeatherMap para los próximos `days` días, con los
+    bloques de 3 horas ya agregados en una fila por día local de la ciudad.
+    """
+    try:
+        data = _fetch_openweather("forecast", place, FORECAST_REFRESH_SECONDS)
+
+        slots = [
+            {
+                "dt": item["dt"],
                 "description": item["weather"][0]["description"],
-                "temperature": {
-                    "min_temp": item["main"]["temp_min"],
-                    "max_temp": item["main"]["temp_max"],
-                },
-                "wind_speed": item["wind"]["speed"]
+                "temp": item["main"]["temp"],
+                "temp_min": item["main"]["temp_min"],
+                "temp_max": item["main"]["temp_max"],
+                "wind_speed": item["wind"]["speed"],
+                "humidity": item["main"]["humidity"],
+                "clouds": item["clouds"]["all"],
+                "rain": item.get("rain", {}).get("3h", 0)
             }
+            for item in data["list"]
+        ]
+        timezone_offset = data["city"].get("timezone", 0)
+        if "coord" in data["city"]:
+            gazetteer.remember(place, data["city"]["name"], data["city"].get("country"),
+                               data["city"]["coord"]["lat"], data["city"]["coord"]["lon"])
 
-            out_data["forecasts"].append(forecast)
+        out_data = {
+            "city": data["city"]["name"],
+            "timezone": timezone_offset,
+            "forecasts": aggregate_daily(slots, timezone_offset)[:days]
+        }
 
         return out_data
 
@@ -68,38 +92,14 @@ def get_forecast_weather(place: str, days: int):
         return None
 
 
-@tool
-def get_weather(city: str):
+def fetch_current_weather(city: str):
     """
-    MANDATORY TOOL: Get REAL current weather data from OpenWeatherMap API.
-
-    This tool makes an actual API call to get live weather data.
-    DO NOT invent or make up weather data. ALWAYS use this tool.
-
-    Args:
-        city: Name of the city (e.g., "Tunja, CO", "Bogotá")
-
-    Returns:
-        dict: Real weather data from API including:
-            - name: city name
-            - weather: temperature, status, description, humidity, wind_speed, rain, clouds
-
-    Example usage:
-        get_weather(city="Tunja, CO")
+    Clima actual de OpenWeatherMap con las coordenadas de la ciudad.
     """
-
-    parameters = {
-        "q": city,
-        "appid": os.getenv("WEATHER_API"),
-        "units": "metric",
-        "lang": "es"
-    }
-
     try:
-        response = requests.get("https://api.openweathermap.org/data/2.5/weather", params=parameters)
-        response.raise_for_status()
-
-        data = response.json()
+        data = _fetch_openweather("weather", city, CURRENT_REFRESH_SECONDS)
+        gazetteer.remember(city, data["name"], data.get("sys", {}).get("country"),
+                           data["coord"]["lat"], data["coord"]["lon"])
 
         out_data = {
             "name": data["name"],
@@ -123,3 +123,77 @@ def get_weather(city: str):
     except requests.exceptions.RequestException as e:
         print(f"Error al obtener datos: {e}")
         return None
+
+
+def fetch_coordinates(city: str) -> Tuple[Optional[float], Optional[float]]:
+    """
+    (lat, lon) de la ciudad según /weather (con cache, la misma consulta del
+    agente del clima), sin pasar por el agente; la deja registrada en el
+    gazetteer.
+    """
+    current = fetch_current_weather(city)
+    if current is None:
+        return None, None
+    return current["coordinates"]["lat"], current["coordinates"]["lon"]
+
+
+def fetch_weather_bundle(city: str, days: int):
+    """
+    Consulta /weather y /forecast en paralelo sobre la sesión compartida.
+
+    Returns:
+        Tupla (clima actual, pronóstico); cualquiera puede ser None si la API falla
+    """
+    forecast_future = submit(http_executor, fetch_forecast, city, days)
+    current = fetch_current_weather(city)
+    return current, forecast_future.result()
+
+
+@tool
+def get_forecast_weather(place: str, days: int):
+    """
+    MANDATORY TOOL: Get REAL weather forecast from OpenWeatherMap API.
+
+    This tool makes an actual API call to get future weather predictions.
+    DO NOT invent forecast data. ALWAYS use this tool.
+
+    Args:
+        place: City name (e.g., "Tunja, CO", "Bogotá")
+        days: Number of days to forecast (1-5, API provides data every 3 hours)
+
+    Returns:
+        dict: Real forecast data from API, one entry per local day including:
+            - date: local calendar day (YYYY-MM-DD)
+            - description: most frequent weather description of the day
+            - temperature: min, max and mean temperatures
+            - wind_speed: maximum wind speed
+            - humidity, clouds (mean %) and rain (total mm)
+
+    Example usage:
+        get_forecast_weather(place="Tunja, CO", days=3)
+    """
+
+    return fetch_forecast(place, days)
+
+
+@tool
+def get_weather(city: str):
+    """
+    MANDATORY TOOL: Get REAL current weather data from OpenWeatherMap API.
+
+    This tool makes an actual API call to get live weather data.
+    DO NOT invent or make up weather data. ALWAYS use this tool.
+
+    Args:
+        city: Name of the city (e.g., "Tunja, CO", "Bogotá")
+
+    Returns:
+        dict: Real weather data from API including:
+            - name: city name
+            - weather: temperature, status, description, humidity, wind_speed, rain, clouds
+
+    Example usage:
+        get_weather(city="Tunja, CO")
+    """
+
+    return fetch_current_weather(city)
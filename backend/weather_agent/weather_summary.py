@@ -0,0 +1,43 @@
+from typing import Any, Dict
+
+# Umbrales para las recomendaciones diarias
+HEAVY_RAIN_MM = 10.0
+LIGHT_RAIN_MM = 1.0
+STRONG_WIND_MS = 10.0
+HOT_TEMP_C = 30.0
+COLD_TEMP_C = 5.0
+CLEAR_SKY_CLOUDS = 30
+OVERCAST_CLOUDS = 70
+RAIN_WORDS = ("lluvia", "llovizna", "tormenta", "chubasco", "rain", "drizzle", "storm")
+
+
+def summarize_day(day: Dict[str, Any]) -> str:
+    """
+    Recomendación de una frase para un día agregado, a partir de lluvia,
+    viento, temperatura y nubosidad (en ese orden de prioridad).
+    """
+    rain = day.get("rain", 0)
+    wind = day["wind_speed"]
+    min_temp = day["temperature"]["min_temp"]
+    max_temp = day["temperature"]["max_temp"]
+    clouds = day["clouds"]
+    description = day.get("description", "").lower()
+    temps = f"entre {min_temp:.0f} y {max_temp:.0f} °C"
+
+    if rain >= HEAVY_RAIN_MM:
+        return f"Lluvia intensa prevista ({rain:.1f} mm): prioriza actividades bajo techo y lleva paraguas."
+    if rain >= LIGHT_RAIN_MM:
+        return f"Posibles lluvias ({rain:.1f} mm) con temperaturas {temps}: lleva paraguas y ten un plan bajo techo."
+    if any(word in description for word in RAIN_WORDS):
+        return f"Pronóstico de {description} con temperaturas {temps}: lleva paraguas por si acaso."
+    if wind >= STRONG_WIND_MS:
+        return f"Vientos fuertes de hasta {wind:.0f} m/s: evita actividades al aire libre muy expuestas."
+    if max_temp >= HOT_TEMP_C:
+        return f"Día caluroso ({max_temp:.0f} °C): hidrátate y evita el sol del mediodía."
+    if min_temp <= COLD_TEMP_C:
+        return f"Día frío con mínimas de {min_temp:.0f} °C: abrígate bien, sobre todo en la mañana y la noche."
+    if clouds <= CLEAR_SKY_CLOUDS:
+        return f"Cielo despejado y temperaturas {temps}: ideal para actividades al aire libre."
+    if clouds >= OVERCAST_CLOUDS:
+        return f"Día nublado con temperaturas {temps}: buen momento para museos y paseos cortos."
+    return f"Temperaturas agradables {temps}: buen día para recorrer la ciudad."
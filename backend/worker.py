@@ -0,0 +1,273 @@
+import functools
+import json
+import os
+import signal
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pika
+
+from batching import MicroBatcher
+from connections import RABBITMQ_URL
+from itinerary_cache import get_cached_itinerary, request_key, store_itinerary
+from itinerary_params import validate_time_string
+from jobs import ITINERARY_EXCHANGE, JOB_HEARTBEAT, JOB_STAGES
+from metrics import on_stage, server_timing, start_breakdown
+from persistence import build_itinerary_row, save_itinerary_rows
+from pipeline import itinerary_flights, normalize_interests, run_itinerary_pipeline
+
+WEATHER_QUEUE = os.getenv('WEATHER_QUEUE')
+TOURISM_QUEUE = os.getenv('TOURISM_QUEUE')
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', '4'))
+WORKER_PREFETCH = int(os.getenv('WORKER_PREFETCH', str(WORKER_CONCURRENCY * 2)))
+# ollama: peticiones paralelas a Ollama; hf: un lote con padding en el
+# pipeline de transformer.py
+GENERATION_BACKEND = os.getenv('GENERATION_BACKEND', 'ollama')
+GENERATION_BATCH_SIZE = int(os.getenv('GENERATION_BATCH_SIZE', str(WORKER_CONCURRENCY)))
+GENERATION_BATCH_WAIT_MS = int(os.getenv('GENERATION_BATCH_WAIT_MS', '200'))
+# Segundos que una mitad espera a su pareja antes de devolverla a la cola
+WORKER_ORPHAN_TIMEOUT = float(os.getenv('WORKER_ORPHAN_TIMEOUT', '60'))
+
+
+def build_generation_batcher() -> MicroBatcher:
+    if GENERATION_BACKEND == 'hf':
+        from transformer import generate_batch as handler, warm_up
+        # Los pesos se cargan al arrancar el worker, no con el primer mensaje
+        warm_up()
+    else:
+        from langchain import generar_itinerarios as handler
+    return MicroBatcher(handler, max_batch=GENERATION_BATCH_SIZE, max_wait=GENERATION_BATCH_WAIT_MS / 1000,
+                        name="generation-batcher")
+
+
+class ItineraryWorker:
+    """
+    Consume las colas de clima y turismo con basic_consume, une las dos partes
+    de cada MessageItinerary por su correlation_id y ejecuta hasta
+    `concurrency` pipelines a la vez.
+
+    Los mensajes solo se confirman (ack) cuando el itinerario quedó guardado
+    en Postgres (o ya estaba en la cache de itinerarios), así que si el
+    proceso se cae o falla el guardado RabbitMQ los vuelve a entregar.
+
+    Una mitad cuya pareja no llega en `orphan_timeout` segundos se devuelve a
+    la cola para no ocupar el prefetch; si ya era una reentrega se descarta.
+    """
+
+    def __init__(self, url: str = RABBITMQ_URL, concurrency: int = WORKER_CONCURRENCY,
+                 prefetch: int = WORKER_PREFETCH, orphan_timeout: float = WORKER_ORPHAN_TIMEOUT,
+                 heartbeat: float = JOB_HEARTBEAT):
+        self.connection = pika.BlockingConnection(pika.URLParameters(url))
+        self.channel = self.connection.channel()
+        for queue in (WEATHER_QUEUE, TOURISM_QUEUE):
+            self.channel.queue_declare(queue=queue, durable=True)
+        self.channel.exchange_declare(exchange=ITINERARY_EXCHANGE, exchange_type='fanout', durable=True)
+        # prefetch por consumidor: cada cola tiene su propia ventana
+        self.channel.basic_qos(prefetch_count=prefetch)
+
+        self.concurrency = concurrency
+        self.prefetch = prefetch
+        self.orphan_timeout = orphan_timeout
+        self.heartbeat = heartbeat
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="itinerary")
+        # Los pipelines terminan los agentes en momentos distintos; el batcher
+        # junta los prompts que coinciden en la ventana en una sola generación
+        self.batcher = build_generation_batcher()
+        # future -> correlation_id de los pipelines en curso
+        self.in_flight = {}
+        # Solo se tocan desde el hilo de la conexión (callbacks de pika)
+        self.pending = {}
+        self.uncorrelated = {"weather": deque(), "tourism": deque()}
+
+    def run(self) -> None:
+        self.channel.basic_consume(queue=WEATHER_QUEUE,
+                                   on_message_callback=functools.partial(self._on_message, "weather"))
+        self.channel.basic_consume(queue=TOURISM_QUEUE,
+                                   on_message_callback=functools.partial(self._on_message, "tourism"))
+        self.connection.call_later(self.orphan_timeout / 2, self._expire_orphans)
+        self.connection.call_later(self.heartbeat, self._send_heartbeats)
+        print(f"Worker escuchando {WEATHER_QUEUE} y {TOURISM_QUEUE} "
+              f"({self.concurrency} pipelines, prefetch {self.prefetch})")
+        try:
+            self.channel.start_consuming()
+        except KeyboardInterrupt:
+            self.channel.stop_consuming()
+        self._drain()
+
+    def request_stop(self) -> None:
+        self.connection.add_callback_threadsafe(self.channel.stop_consuming)
+
+    def _drain(self) -> None:
+        print("Deteniendo worker, esperando itinerarios en curso...")
+        # Los acks de los pipelines en curso llegan como callbacks de la conexión
+        while self.in_flight:
+            self.connection.process_data_events(time_limit=1)
+        self.executor.shutdown(wait=True)
+        self.batcher.close()
+        print(f"Generación: {self.batcher.items} itinerarios en {self.batcher.batches} lotes")
+        # Las mitades sin pareja vuelven a la cola al cerrar la conexión
+        self.connection.close()
+
+    def _on_message(self, kind, channel, method, properties, body) -> None:
+        correlation_id = properties.correlation_id
+        try:
+            message = json.loads(body.decode())
+        except ValueError as e:
+            # Una excepción aquí cortaría start_consuming, y la reentrega del
+            # mismo mensaje tumbaría a cada worker siguiente
+            print(f"Mensaje {correlation_id} de {kind} inválido, se descarta: {e}")
+            self.channel.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            if correlation_id:
+                self._publish(correlation_id, json.dumps(
+                    {"status": "failed", "error": f"Mensaje de {kind} inválido"}, ensure_ascii=False
+                ))
+            return
+        half = (method.delivery_tag, method.redelivered, message, time.monotonic())
+
+        if correlation_id is None:
+            # Mensajes antiguos sin correlation_id: se emparejan por orden de llegada
+            other = "tourism" if kind == "weather" else "weather"
+            if self.uncorrelated[other]:
+                pair = {kind: half, other: self.uncorrelated[other].popleft()}
+                self._dispatch(None, pair)
+            else:
+                self.uncorrelated[kind].append(half)
+            return
+
+        pair = self.pending.setdefault(correlation_id, {})
+        pair[kind] = half
+        if len(pair) == 2:
+            del self.pending[correlation_id]
+            self._dispatch(correlation_id, pair)
+
+    def _expire_orphans(self) -> None:
+        """
+        Timer del hilo de la conexión: devuelve a la cola (nack con requeue)
+        las mitades que llevan más de `orphan_timeout` segundos sin pareja.
+        Las que ya eran reentregas se descartan y su job se marca fallido,
+        igual que un pipeline que falla dos veces.
+        """
+        deadline = time.monotonic() - self.orphan_timeout
+        for correlation_id, pair in list(self.pending.items()):
+            # En pending solo quedan mitades sueltas; las parejas ya salieron
+            half = next(iter(pair.values()))
+            if half[3] < deadline:
+                del self.pending[correlation_id]
+                self._release_orphan(correlation_id, half)
+        for halves in self.uncorrelated.values():
+            while halves and halves[0][3] < deadline:
+                self._release_orphan(None, halves.popleft())
+        self.connection.call_later(self.orphan_timeout / 2, self._expire_orphans)
+
+    def _release_orphan(self, correlation_id, half) -> None:
+        tag, redelivered = half[0], half[1]
+        print(f"Mensaje {correlation_id} sin pareja tras {self.orphan_timeout:.0f} s"
+              f"{', se descarta' if redelivered else ', vuelve a la cola'}")
+        self.channel.basic_nack(delivery_tag=tag, requeue=not redelivered)
+        if correlation_id and redelivered:
+            self._publish(correlation_id, json.dumps(
+                {"status": "failed", "error": "Falta el mensaje de clima o de turismo"}, ensure_ascii=False
+            ))
+
+    def _send_heartbeats(self) -> None:
+        """
+        Timer del hilo de la conexión: avisa a la API que cada job en curso
+        sigue vivo, para que no lo dé por perdido (JOB_DEADLINE) mientras la
+        generación no termina ninguna etapa.
+        """
+        for correlation_id in set(self.in_flight.values()):
+            if correlation_id:
+                self._publish(correlation_id, json.dumps({"status": "heartbeat"}))
+        self.connection.call_later(self.heartbeat, self._send_heartbeats)
+
+    def _dispatch(self, correlation_id, pair) -> None:
+        future = self.executor.submit(self._process, correlation_id, pair["weather"][2], pair["tourism"][2])
+        self.in_flight[future] = correlation_id
+        tags = [(pair["weather"][0], pair["weather"][1]), (pair["tourism"][0], pair["tourism"][1])]
+        future.add_done_callback(
+            lambda f: self.connection.add_callback_threadsafe(functools.partial(self._settle, correlation_id, f, tags))
+        )
+
+    def _process(self, correlation_id, weather_message, tourism_message) -> str:
+        city = weather_message["city"]
+        time = weather_message["time"]
+        print(f"Procesando itinerario {correlation_id} para {city}")
+        breakdown = start_breakdown()
+        # El correlation_id es el job_id de la API: cada etapa terminada se le
+        # avisa por ITINERARY_EXCHANGE
+        on_stage(functools.partial(self._report_stage, correlation_id) if correlation_id else None)
+        if correlation_id:
+            self._publish_event(correlation_id, {"status": "running"})
+
+        interests = normalize_interests(tourism_message["interests"])
+        days = validate_time_string(time)
+
+        def compute():
+            cached = get_cached_itinerary(city, days, interests)
+            if cached is not None:
+                return cached
+            generated = run_itinerary_pipeline(city, time, interests, generate=self.batcher)
+            # Sin capturar errores: si Postgres falla los mensajes no se
+            # confirman. La cache se llena después para que la reentrega no
+            # la encuentre y vuelva a guardar
+            save_itinerary_rows([build_itinerary_row(
+                city=city,
+                time_str=time,
+                weather_data=generated["weather"],
+                tourism_data=generated["tourism"],
+                itinerary_text=generated["itinerary"]
+            )])
+            store_itinerary(city, days, interests, generated)
+            return generated
+
+        # Mensajes idénticos en vuelo comparten un solo pipeline
+        result = itinerary_flights.do(request_key(city, days, interests), compute)
+        print(f"Tiempos de {correlation_id}: {server_timing(breakdown)}")
+        return json.dumps({
+            "status": "done",
+            "city": city,
+            "itinerary": result["itinerary"]
+        }, ensure_ascii=False)
+
+    def _report_stage(self, correlation_id, stage, seconds) -> None:
+        if stage in JOB_STAGES:
+            self._publish_event(correlation_id, {"status": "running", "stage": stage})
+
+    def _publish_event(self, correlation_id, event) -> None:
+        """Desde cualquier hilo: el canal solo se usa en el hilo de la conexión."""
+        self.connection.add_callback_threadsafe(functools.partial(
+            self._publish, correlation_id, json.dumps(event, ensure_ascii=False)
+        ))
+
+    def _publish(self, correlation_id, body) -> None:
+        # Fanout: llega a la cola de cada réplica de la API
+        self.channel.basic_publish(
+            exchange=ITINERARY_EXCHANGE,
+            routing_key='',
+            body=body,
+            properties=pika.BasicProperties(correlation_id=correlation_id)
+        )
+
+    def _settle(self, correlation_id, future, tags) -> None:
+        """Corre en el hilo de la conexión: publica el resultado y hace ack/nack."""
+        self.in_flight.pop(future, None)
+        error = future.exception()
+        if error is None:
+            self._publish(correlation_id, future.result())
+            for tag, _ in tags:
+                self.channel.basic_ack(delivery_tag=tag)
+            return
+
+        print(f"Error generando itinerario: {error}")
+        for tag, redelivered in tags:
+            # Un reintento; si vuelve a fallar se descarta para no ciclar
+            self.channel.basic_nack(delivery_tag=tag, requeue=not redelivered)
+        if correlation_id and any(redelivered for _, redelivered in tags):
+            self._publish(correlation_id, json.dumps({"status": "failed", "error": str(error)}, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    worker = ItineraryWorker()
+    signal.signal(signal.SIGTERM, lambda *_: worker.request_stop())
+    worker.run()
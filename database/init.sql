@@ -51,9 +51,46 @@ CREATE TABLE prompts (
 );
 
 
+-- Las llaves de Places crecen con cada categoría, por eso TEXT
+CREATE TABLE api_cache (
+    cache_key TEXT PRIMARY KEY,
+    value JSONB NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+
+CREATE TABLE itinerary_cache (
+    request_hash CHAR(64) PRIMARY KEY,
+    city VARCHAR(150) NOT NULL,
+    days INTEGER NOT NULL,
+    interests JSONB,
+    itinerary_text TEXT NOT NULL,
+    weather JSONB,
+    tourism JSONB,
+    hits INTEGER DEFAULT 0,
+    last_hit_at TIMESTAMP,
+    expires_at TIMESTAMPTZ NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+
+-- Ciudad o código postal normalizado -> coordenadas, aprendido de OpenWeather
+CREATE TABLE gazetteer (
+    query_key VARCHAR(150) PRIMARY KEY,
+    name VARCHAR(150) NOT NULL,
+    country VARCHAR(10),
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+
 CREATE INDEX idx_itineraries_user ON itineraries(user_id);
 CREATE INDEX idx_weather_itinerary ON weather(itinerary_id);
 CREATE INDEX idx_destinations_itinerary ON destinations(itinerary_id);
+CREATE INDEX idx_api_cache_expires ON api_cache(expires_at);
+CREATE INDEX idx_itinerary_cache_expires ON itinerary_cache(expires_at);
 
 
 CREATE OR REPLACE FUNCTION update_timestamp()
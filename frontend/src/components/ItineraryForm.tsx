@@ -6,12 +6,83 @@ import {Button} from "@/components/ui/button";
 import {Label} from "@/components/ui/label";
 import {MapPin, Calendar, Heart, Sparkles, Loader2} from "lucide-react";
 
+const API_BASE = "http://api.localhost";
+
+// Estado de un job tal como lo devuelve /itineraries/{job_id}
+type JobSnapshot = {
+    job_id: string;
+    status: "queued" | "running" | "done" | "failed";
+    stage: string | null;
+    progress: number;
+    version: number;
+    itinerary?: string;
+    error?: string;
+};
+
+// Última etapa terminada del job
+const STAGE_LABELS: Record<string, string> = {
+    "weather": "clima listo",
+    "tourism.categories": "categorías elegidas",
+    "tourism.search": "lugares encontrados",
+    "tourism.places": "lugares elegidos",
+    "ollama.generate": "itinerario redactado"
+};
+
+// Espera el resultado del job por SSE; si el canal falla sigue con long-poll
+const waitForJob = (jobId: string, signal: AbortSignal, onProgress: (job: JobSnapshot) => void) =>
+    new Promise<JobSnapshot>((resolve, reject) => {
+        let version = -1;
+        const events = new EventSource(`${API_BASE}/itineraries/${jobId}/events`);
+        const finish = (job: JobSnapshot) => {
+            events.close();
+            resolve(job);
+        };
+        const onEvent = (e: MessageEvent) => {
+            const job: JobSnapshot = JSON.parse(e.data);
+            version = job.version;
+            if (job.status === "done" || job.status === "failed") {
+                finish(job);
+            } else {
+                onProgress(job);
+            }
+        };
+        events.addEventListener("progress", onEvent);
+        events.addEventListener("done", onEvent);
+        events.addEventListener("failed", onEvent);
+        signal.addEventListener("abort", () => {
+            events.close();
+            reject(new DOMException("Aborted", "AbortError"));
+        });
+
+        events.onerror = async () => {
+            events.close();
+            try {
+                while (true) {
+                    const res = await fetch(`${API_BASE}/itineraries/${jobId}?wait=25&version=${version}`, {signal});
+                    if (!res.ok) {
+                        throw new Error(`HTTP ${res.status} consultando el job ${jobId}`);
+                    }
+                    const job: JobSnapshot = await res.json();
+                    version = job.version;
+                    if (job.status === "done" || job.status === "failed") {
+                        resolve(job);
+                        return;
+                    }
+                    onProgress(job);
+                }
+            } catch (err) {
+                reject(err);
+            }
+        };
+    });
+
 export const ItineraryForm = () => {
     const [city, setCity] = useState("");
     const [dateRange, setDateRange] = useState("");
     const [interests, setInterests] = useState("");
     const [itinerary, setItinerary] = useState("");
     const [isLoading, setIsLoading] = useState(false);
+    const [stage, setStage] = useState("");
 
     const handleGenerate = async () => {
         if (!city || !dateRange || !interests) {
@@ -23,12 +94,12 @@ export const ItineraryForm = () => {
             .map(s => s.trim())
             .filter(Boolean);
 
-        const API_BASE = "http://api.localhost";
         const controller = new AbortController();
         const timeoutMs = 600000;
         const t = setTimeout(() => controller.abort(), timeoutMs);
 
         setIsLoading(true);
+        setStage("");
 
         // Función auxiliar para leer el detalle del error del backend
         const readError = async (res: Response) => {
@@ -72,19 +143,19 @@ export const ItineraryForm = () => {
                 return; // cortar flujo y dejar de cargar en finally
             }
 
-            // 3) GET
-            const getRes = await fetch(`${API_BASE}/getItineraryInfo`, {
-                signal: controller.signal
+            // 3) El backend responde con el id del job; el itinerario llega
+            // por SSE cuando está listo
+            const {job_id} = await sendRes.json();
+            const job = await waitForJob(job_id, controller.signal, (progress) => {
+                const label = progress.stage ? STAGE_LABELS[progress.stage] || progress.stage : "en cola";
+                setStage(`${Math.round(progress.progress * 100)}% · ${label}`);
             });
 
-            if (!getRes.ok) {
-                const detail = await readError(getRes);
-                setItinerary(`❌ Error obteniendo el itinerario. Detalle: ${detail}`);
+            if (job.status === "failed") {
+                setItinerary(`❌ Error obteniendo el itinerario. Detalle: ${job.error || "desconocido"}`);
                 return;
             }
-
-            const data = await getRes.text();
-            setItinerary(data);
+            setItinerary(job.itinerary || "");
         } catch (err: any) {
             // 5) Errores de red/timeout/abort
             if (err?.name === "AbortError") {
@@ -96,6 +167,7 @@ export const ItineraryForm = () => {
             // 6) Siempre deja de "cargar"
             clearTimeout(t);
             setIsLoading(false);
+            setStage("");
         }
     };
 
@@ -166,7 +238,7 @@ export const ItineraryForm = () => {
                         {isLoading ? (
                             <>
                                 <Loader2 className="w-5 h-5 animate-spin"/>
-                                Generando tu itinerario...
+                                Generando tu itinerario...{stage && ` (${stage})`}
                             </>
                         ) : (
                             <>